@@ -1,45 +1,609 @@
 import os
 import sys
-from flask import Flask, request, abort, jsonify
+import base64
+import binascii
+import datetime
+import itertools
+from flask import Flask, Response, request, abort, jsonify, json, g
+from flask import stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-from sqlalchemy import exc
+from sqlalchemy import exc, func, tuple_
+from dateutil import parser as date_parser
 from models import db, Movies, Actors, Relation, setup_db
-from auth import requires_auth, AuthError
-from config import auth_config
-
-
-def conv_actor_list_to_dict(actors_list):
-    dict_of_actors = {}
-    for actor in actors_list:
-        if actor[0] not in dict_of_actors:
-            if actor[1]:
-                dict_of_actors[actor[0]] = [actor[1].title]
-            else:
-                dict_of_actors[actor[0]] = []
-        else:
-            dict_of_actors[actor[0]].append(actor[1].title)
-    return dict_of_actors
-
-
-def conv_movie_list_to_dict(movies_list):
-    dict_of_movies = {}
-    for movie in movies_list:
-        if movie[0] not in dict_of_movies:
-            if movie[1]:
-                dict_of_movies[movie[0]] = [movie[1].name]
-            else:
-                dict_of_movies[movie[0]] = []
+from models import database_path, replica_path
+from models import insert_many, insert_relations, delete_many
+from models import update_row, update_many
+from models import bump_catalog_version, get_catalog_version
+from auth import requires_auth, AuthError, warm_jwks
+from cache import response_cache
+from metrics import request_metrics
+from encoder import dumps, ISODateJSONEncoder
+from compression import negotiate_encoding, compress, compress_stream
+from compression import entity_tag, ENCODINGS
+from query_budget import query_budget
+from idempotency import idempotent
+from replica import replica_router
+from config import auth_config, api_config
+
+
+def movie_titles_query(actor_ids):
+    return db.session.query(Relation.actor_id, Movies.title).join(
+        Movies, Relation.movie_id == Movies.id).filter(
+        Relation.actor_id.in_(actor_ids)).order_by(Movies.id)
+
+
+def actor_names_query(movie_ids):
+    return db.session.query(Relation.movie_id, Actors.name).join(
+        Actors, Relation.actor_id == Actors.id).filter(
+        Relation.movie_id.in_(movie_ids)).order_by(Actors.id)
+
+
+def group_names(ids, rows):
+    names = {id: [] for id in ids}
+    for id, name in rows:
+        names[id].append(name)
+    return names
+
+
+def movie_titles_by_actor(actor_ids):
+    return group_names(actor_ids,
+                       movie_titles_query(actor_ids) if actor_ids else [])
+
+
+def actor_names_by_movie(movie_ids):
+    return group_names(movie_ids,
+                       actor_names_query(movie_ids) if movie_ids else [])
+
+
+def format_with_cast(rows, names_by_id):
+    names = names_by_id([row.id for row in rows])
+    return [row.format(names[row.id]) for row in rows]
+
+
+FIELDS = {
+    Actors: ('id', 'name', 'age', 'gender'),
+    Movies: ('id', 'title', 'release_date')
+}
+
+CAST_KEYS = {
+    Actors: 'movies',
+    Movies: 'actors'
+}
+
+SORT_FIELDS = {
+    Actors: ('id', 'name', 'age'),
+    Movies: ('id', 'title', 'release_date')
+}
+
+
+def is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def parse_date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# Turns a sort value taken from a cursor back into one for the query, or
+# None when it is not a value of that field.
+CURSOR_VALUES = {
+    'name': lambda value: value if isinstance(value, str) else None,
+    'title': lambda value: value if isinstance(value, str) else None,
+    'age': lambda value: value if is_int(value) else None,
+    'release_date': parse_date
+}
+
+
+def get_view(model):
+    # Returns the fields to render and the cast key, or None when the cast
+    # was not asked for. Without ?fields= or ?include= everything is
+    # rendered, as before; the id is always rendered.
+    cast_key = CAST_KEYS[model]
+    fields = request.args.get('fields', None)
+    include = request.args.get('include', None)
+    if fields is None and include is None:
+        return list(FIELDS[model]), cast_key
+    names = [name for name in (fields or '').split(',') if name]
+    included = [name for name in (include or '').split(',') if name]
+    if any(name not in FIELDS[model] + (cast_key,) for name in names) or \
+            any(name != cast_key for name in included):
+        abort(422)
+    selected = [name for name in FIELDS[model]
+                if fields is None or name == 'id' or name in names]
+    if cast_key in names or cast_key in included:
+        return selected, cast_key
+    return selected, None
+
+
+def format_rows(rows, names_by_id, view):
+    fields, cast_key = view
+    if cast_key:
+        items = format_with_cast(rows, names_by_id)
+        fields = fields + [cast_key]
+    else:
+        items = [row.format(None) for row in rows]
+    return [{field: item[field] for field in fields} for item in items]
+
+
+def encode_cursor(values):
+    cursor = base64.urlsafe_b64encode(
+        json.dumps(values, separators=(',', ':')).encode())
+    return cursor.rstrip(b'=').decode()
+
+
+def decode_cursor(cursor):
+    padding = '=' * (-len(cursor) % 4)
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except (binascii.Error, UnicodeError, ValueError):
+        abort(422)
+    if is_int(values):
+        values = [values]
+    if not isinstance(values, list) or not values or \
+            not is_int(values[-1]):
+        abort(422)
+    return values
+
+
+def get_page_args():
+    limit = get_int_arg('limit', api_config['MAX_PAGE_SIZE'])
+    if limit < 1:
+        abort(422)
+    limit = min(limit, api_config['MAX_PAGE_SIZE'])
+    after = request.args.get('after', None)
+    if after is not None:
+        after = decode_cursor(after)
+    return limit, after
+
+
+def get_int_arg(name, default=None):
+    value = request.args.get(name, None)
+    if value is None:
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        abort(422)
+
+
+def get_date_arg(name):
+    value = request.args.get(name, None)
+    if value is None:
+        return None
+    try:
+        return date_parser.parse(value).date()
+    except (ValueError, OverflowError):
+        abort(422)
+
+
+def starts_with(column, prefix):
+    # Case-insensitive, served by the lower(column) varchar_pattern_ops
+    # indexes.
+    prefix = prefix.lower().replace('\\', '\\\\').replace(
+        '%', '\\%').replace('_', '\\_')
+    return func.lower(column).like(prefix + '%', escape='\\')
+
+
+def filter_actors(query):
+    name = request.args.get('name', None)
+    if name:
+        query = query.filter(starts_with(Actors.name, name))
+    min_age = get_int_arg('min_age')
+    if min_age is not None:
+        query = query.filter(Actors.age >= min_age)
+    max_age = get_int_arg('max_age')
+    if max_age is not None:
+        query = query.filter(Actors.age <= max_age)
+    gender = request.args.get('gender', None)
+    if gender is not None:
+        if gender not in Actors.gender.type.enums:
+            abort(422)
+        query = query.filter(Actors.gender == gender)
+    return query
+
+
+def filter_movies(query):
+    title = request.args.get('title', None)
+    if title:
+        query = query.filter(starts_with(Movies.title, title))
+    released_after = get_date_arg('released_after')
+    if released_after is not None:
+        query = query.filter(Movies.release_date >= released_after)
+    released_before = get_date_arg('released_before')
+    if released_before is not None:
+        query = query.filter(Movies.release_date <= released_before)
+    return query
+
+
+LIST_FILTERS = {
+    Actors: filter_actors,
+    Movies: filter_movies
+}
+
+
+def get_sort(model):
+    sort = request.args.get('sort', 'id')
+    descending = sort.startswith('-')
+    field = sort[1:] if descending else sort
+    if field not in SORT_FIELDS[model]:
+        abort(422)
+    return field, descending
+
+
+def list_queries(model):
+    # The listing as queries run one after the other, each in the order of
+    # an index so that it reads a range of it: for a sort field, the rows
+    # with a value in (field, id) order, then those without one, which
+    # come last in either direction, in id order.
+    field, descending = get_sort(model)
+    query = LIST_FILTERS[model](model.query)
+
+    def order(*columns):
+        return [column.desc() if descending else column
+                for column in columns]
+
+    if field == 'id':
+        return [query.order_by(*order(model.id))], field, descending
+    column = getattr(model, field)
+    queries = [
+        query.filter(column.isnot(None)).order_by(*order(column, model.id)),
+        query.filter(column.is_(None)).order_by(*order(model.id))]
+    return queries, field, descending
+
+
+def sort_key(row, field):
+    # The cursor of a sorted listing names its field, so it cannot be used
+    # with another sort; a null value marks a row from the null tail.
+    if field == 'id':
+        return [row.id]
+    value = getattr(row, field)
+    if isinstance(value, datetime.date):
+        value = value.isoformat()
+    return [field, value, row.id]
+
+
+def after_cursor(queries, model, field, descending, after):
+    # Narrows the listing's queries to the rows after the cursor, leaving
+    # out those that end before it; each keeps to a range of its index.
+    def later(key, value):
+        return key < value if descending else key > value
+
+    if field == 'id':
+        if len(after) != 1:
+            abort(422)
+        return [queries[0].filter(later(model.id, after[0]))]
+    if len(after) != 3 or after[0] != field:
+        abort(422)
+    with_value, without_value = queries
+    if after[1] is None:
+        return [without_value.filter(later(model.id, after[2]))]
+    value = CURSOR_VALUES[field](after[1])
+    if value is None:
+        abort(422)
+    return [with_value.filter(later(tuple_(getattr(model, field), model.id),
+                                    tuple_(value, after[2]))),
+            without_value]
+
+
+def page_queries(model, after):
+    queries, field, descending = list_queries(model)
+    if after is not None:
+        queries = after_cursor(queries, model, field, descending, after)
+    return queries, field
+
+
+def finish_page(rows, limit, field):
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(sort_key(rows[-1], field))
+
+
+def get_page(model, limit, after):
+    # One extra row tells whether there is a next page. The null tail is
+    # only read once the rows with a value run out before the page fills.
+    queries, field = page_queries(model, after)
+    rows = []
+    for query in queries:
+        rows += query.limit(limit + 1 - len(rows)).all()
+        if len(rows) > limit:
+            break
+    return finish_page(rows, limit, field)
+
+
+def not_modified(version):
+    # Compares the client's If-None-Match with the tags of every encoding
+    # of the catalog version before any list query runs.
+    for encoding in (None,) + ENCODINGS:
+        tag = entity_tag(version, encoding)
+        if request.if_none_match.contains(tag):
+            response = Response(status=304)
+            response.set_etag(tag)
+            response.vary.add('Accept-Encoding')
+            return response
+    return None
+
+
+def stream_list(key, rows, names_by_id, view):
+    # Cast names are loaded one batch of parent rows at a time, while
+    # the parents themselves are read through a server-side cursor.
+    batch_size = api_config['STREAM_BATCH_SIZE']
+    yield ('{"success":true,"%s":[' % key).encode()
+    separator = b''
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            with request_metrics.phase('serialize'):
+                chunk = separator + b','.join(
+                    dumps(item) for item in format_rows(
+                        batch, names_by_id, view))
+            yield chunk
+            separator = b','
+            batch = []
+    if batch:
+        with request_metrics.phase('serialize'):
+            chunk = separator + b','.join(
+                dumps(item) for item in format_rows(
+                    batch, names_by_id, view))
+        yield chunk
+    yield b']}'
+
+
+def stream_response(key, model, names_by_id, view):
+    rows = itertools.chain.from_iterable(
+        query.yield_per(api_config['STREAM_BATCH_SIZE'])
+        for query in list_queries(model)[0])
+    chunks = stream_list(key, rows, names_by_id, view)
+    encoding = negotiate_encoding()
+    if encoding:
+        chunks = compress_stream(chunks, encoding)
+    response = Response(stream_with_context(chunks),
+                        mimetype='application/json')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def validate_actor(item, partial=False):
+    # With partial=True any of the fields may be left out, but not all.
+    if not isinstance(item, dict):
+        return None, "Actor must be an object"
+    error = check_fields(item, ('name', 'age', 'gender'), partial)
+    if error:
+        return None, error
+    if 'name' in item and (not isinstance(item['name'], str)
+                           or not item['name']):
+        return None, "name must be a non-empty string"
+    if 'age' in item and (not isinstance(item['age'], int)
+                          or isinstance(item['age'], bool)
+                          or item['age'] < 0):
+        return None, "age must be a non-negative integer"
+    if 'gender' in item and item['gender'] not in Actors.gender.type.enums:
+        return None, "gender must be one of " + ", ".join(
+            Actors.gender.type.enums)
+    return {key: item[key] for key in ('name', 'age', 'gender')
+            if key in item}, None
+
+
+def validate_movie(item, partial=False):
+    if not isinstance(item, dict):
+        return None, "Movie must be an object"
+    error = check_fields(item, ('title', 'release_date'), partial)
+    if error:
+        return None, error
+    if 'title' in item and (not isinstance(item['title'], str)
+                            or not item['title']):
+        return None, "title must be a non-empty string"
+    row = {key: item[key] for key in ('title', 'release_date')
+           if key in item}
+    if 'release_date' in item:
+        try:
+            row['release_date'] = date_parser.parse(
+                item['release_date']).date()
+        except (TypeError, ValueError, OverflowError):
+            return None, "release_date must be a date (mm/dd/yyyy)"
+    return row, None
+
+
+def check_fields(item, keys, partial):
+    if partial:
+        if not any(key in item for key in keys):
+            return "Expected at least one of " + ", ".join(keys)
+        return None
+    missing = [key for key in keys if key not in item]
+    if missing:
+        return "Missing " + ", ".join(missing)
+    return None
+
+
+def validate_update(validate):
+    # An item of a bulk PATCH: the id of the row and the fields to change.
+    def validate_item(item):
+        if not isinstance(item, dict):
+            return None, "Update must be an object"
+        if not isinstance(item.get('id'), int) or \
+                isinstance(item['id'], bool):
+            return None, "id must be an integer"
+        values, error = validate(
+            {key: value for key, value in item.items() if key != 'id'},
+            partial=True)
+        if error:
+            return None, error
+        return (item['id'], values), None
+    return validate_item
+
+
+def validate_cast(item):
+    if not isinstance(item, dict):
+        return None, "Cast must be an object"
+    missing = [key for key in ('movie_id', 'actor_id') if key not in item]
+    if missing:
+        return None, "Missing " + ", ".join(missing)
+    for key in ('movie_id', 'actor_id'):
+        if not isinstance(item[key], int) or isinstance(item[key], bool):
+            return None, key + " must be an integer"
+    return (item['movie_id'], item['actor_id']), None
+
+
+def validate_batch(validate):
+    items = request.get_json(silent=True)
+    if not isinstance(items, list) or not items:
+        abort(422)
+    if len(items) > api_config['MAX_BATCH_SIZE']:
+        abort(413)
+    rows = []
+    errors = []
+    for index, item in enumerate(items):
+        row, error = validate(item)
+        if error:
+            errors.append({"index": index, "message": error})
+        rows.append(row)
+    return rows, errors
+
+
+def batch_error(errors):
+    return jsonify({
+        "success": False,
+        "message": "Request unprocessable",
+        "error_code": 422,
+        "errors": errors
+    }), 422
+
+
+def get_ids_arg():
+    # ?ids=1,2,3 for the bulk deletes.
+    try:
+        ids = [int(id) for id in request.args.get('ids', '').split(',')]
+    except ValueError:
+        abort(422)
+    if len(ids) > api_config['MAX_BATCH_SIZE']:
+        abort(413)
+    return list(dict.fromkeys(ids))
+
+
+def delete_rows(model, ids, bulk=False):
+    # Deletes the rows and their cast in one transaction. A single delete
+    # that finds nothing is a 404; a bulk one reports the ids it did not
+    # find.
+    try:
+        deleted = delete_many(model, ids)
+        if deleted:
+            bump_catalog_version()
+        elif not bulk:
+            abort(404)
+        db.session.commit()
+    except exc.SQLAlchemyError:
+        db.session.rollback()
+        abort(422)
+    found = set(deleted)
+    return sorted(deleted), [id for id in ids if id not in found]
+
+
+def update_rows(model, updates, bulk=False):
+    # Applies (id, values) updates in one transaction and returns the
+    # updated rows with the ids that did not match one. A single update
+    # that matches nothing is a 404.
+    try:
+        if bulk:
+            rows = update_many(model, updates)
         else:
-            dict_of_movies[movie[0]].append(movie[1].name)
-    return dict_of_movies
+            row = update_row(model, *updates[0])
+            rows = [row] if row else []
+        if rows:
+            bump_catalog_version()
+        elif not bulk:
+            abort(404)
+        db.session.commit()
+    except exc.SQLAlchemyError:
+        db.session.rollback()
+        abort(422)
+    found = {row.id for row in rows}
+    return [dict(row) for row in rows], list(dict.fromkeys(
+        id for id, values in updates if id not in found))
+
+
+def catalog_version():
+    # A client reading its own write skips the cached version, which may be
+    # up to CATALOG_VERSION_TTL old or come from another worker's view.
+    bind = g.get('db_bind')
+    if g.get('read_primary'):
+        return response_cache.set_version(get_catalog_version())
+    return response_cache.current_version(get_catalog_version, bind)
+
+
+def list_response(key, model, names_by_id):
+    version = catalog_version()
+    response = not_modified(version)
+    if response:
+        return response
+    view = get_view(model)
+    if request.args.get('stream') == 'true':
+        response = stream_response(key, model, names_by_id, view)
+        response.set_etag(entity_tag(
+            version, response.headers.get('Content-Encoding')))
+        return response
+    cache_key = (request.endpoint,
+                 tuple(sorted(request.args.items(multi=True))), version)
+    if g.get('db_bind'):
+        # Pages read from a replica are cached apart from the primary's.
+        cache_key += (g.db_bind,)
+    cached = response_cache.get(cache_key)
+    if cached:
+        body, cache_status = cached.body, 'HIT'
+    else:
+        limit, after = get_page_args()
+        rows, next_cursor = get_page(model, limit, after)
+        with request_metrics.phase('serialize'):
+            body = dumps({
+                key: format_rows(rows, names_by_id, view),
+                "next": next_cursor,
+                "success": True
+            })
+        cache_status = 'MISS'
+        response_cache.put(cache_key, body, 'application/json')
+    return body_response(cache_key, body, cache_status, version)
+
+
+def body_response(cache_key, body, cache_status, version):
+    encoding = negotiate_encoding(len(body))
+    if encoding:
+        # The compressed copy is cached with the entry, so a hit is
+        # compressed once rather than on every request.
+        encoded = response_cache.get_encoded(cache_key, encoding)
+        if encoded is None:
+            with request_metrics.phase('serialize'):
+                encoded = compress(body, encoding)
+            response_cache.put_encoded(cache_key, encoding, encoded)
+        response = Response(encoded, mimetype='application/json')
+        response.headers['Content-Encoding'] = encoding
+    else:
+        response = Response(body, mimetype='application/json')
+    response.headers['X-Cache'] = cache_status
+    response.vary.add('Accept-Encoding')
+    response.set_etag(entity_tag(version, encoding))
+    return response
 
 
 def create_app(test_config=None):
-    # create and configure the app
+    # create and configure the app; test_config may point it at other
+    # databases than DATABASE_URL and DATABASE_REPLICA_URL.
+    test_config = test_config or {}
     app = Flask(__name__)
+    app.json_encoder = ISODateJSONEncoder
     CORS(app)
-    setup_db(app)
+    setup_db(app, test_config.get('DATABASE_URL', database_path),
+             test_config.get('DATABASE_REPLICA_URL', replica_path))
+    request_metrics.init_app(app)
+    replica_router.init_app(app)
+    query_budget.init_app(app)
+    if auth_config['JWKS_PRELOAD']:
+        warm_jwks()
 
     # Uncomment this for authorization
 
@@ -64,9 +628,13 @@ def create_app(test_config=None):
     def home():
         message = "Welcome to my Casting Agency API"
         endpoint = ("GET /actors,GET /movies, POST /actors, "
-                    "POST /movies, POST /movies/cast, DELETE /actors/id, "
-                    "DELETE /movies/id, DELETE /movies/cast,"
-                    "PATCH /movies/id, PATCH /actors/id")
+                    "POST /movies, POST /actors/bulk, POST /movies/bulk, "
+                    "POST /movies/cast, POST /movies/cast/bulk, "
+                    "DELETE /actors/id, DELETE /actors?ids=, "
+                    "DELETE /movies/id, DELETE /movies?ids=, "
+                    "DELETE /movies/cast,"
+                    "PATCH /movies/id, PATCH /actors/id, "
+                    "PATCH /movies, PATCH /actors")
         note = "Make sure you have permission to access these endpoints"
         return jsonify({
             "message": message,
@@ -78,41 +646,26 @@ def create_app(test_config=None):
     @app.route("/actors")
     @requires_auth('get:actors')
     def get_actors(payload):
-        list_of_actors = db.session.query(Actors, Movies).outerjoin(
-            Relation, Relation.actor_id == Actors.id).outerjoin(
-            Movies, Relation.movie_id == Movies.id).order_by(Actors.id).all()
-        dict_of_actors = conv_actor_list_to_dict(list_of_actors)
-        list_of_actors = [actor.format(dict_of_actors[actor])
-                          for actor in dict_of_actors]
-        return jsonify({
-            "actors": list_of_actors,
-            "success": True
-        })
+        return list_response('actors', Actors, movie_titles_by_actor)
 
     @app.route("/movies")
     @requires_auth('get:movies')
     def get_movies(payload):
-        list_of_movies = db.session.query(Movies, Actors).outerjoin(
-            Relation, Relation.movie_id == Movies.id).outerjoin(
-            Actors, Relation.actor_id == Actors.id).order_by(Movies.id).all()
-        # print(list_of_movies)
-        dict_of_movies = conv_movie_list_to_dict(list_of_movies)
-        list_of_movies = [movie.format(dict_of_movies[movie])
-                          for movie in dict_of_movies]
-        return jsonify({
-            "movies": list_of_movies,
-            "success": True
-        })
+        return list_response('movies', Movies, actor_names_by_movie)
 
     @app.route("/actors", methods=["POST"])
     @requires_auth('post:actors')
+    @idempotent
     def add_actor(payload):
         try:
             name = request.get_json()['name']
             age = request.get_json()['age']
             gender = request.get_json()['gender']
             actor = Actors(name=name, age=age, gender=gender)
-            actor.insert()
+            db.session.add(actor)
+            db.session.flush()
+            bump_catalog_version()
+            Actors.commit()
         except:
             Actors.rollback()
             abort(422)
@@ -125,12 +678,17 @@ def create_app(test_config=None):
 
     @app.route("/movies", methods=["POST"])
     @requires_auth('post:movies')
+    @idempotent
     def add_movie(payload):
         try:
             title = request.get_json()['title']
             release_date = request.get_json()['release_date']
-            movie = Movies(title=title, release_date=release_date)
-            movie.insert()
+            movie = Movies(title=title, release_date=date_parser.parse(
+                release_date).date())
+            db.session.add(movie)
+            db.session.flush()
+            bump_catalog_version()
+            Movies.commit()
         except:
             Movies.rollback()
             abort(422)
@@ -141,8 +699,47 @@ def create_app(test_config=None):
             "success": True
         })
 
+    @app.route("/actors/bulk", methods=["POST"])
+    @requires_auth('post:actors')
+    @idempotent
+    def add_actors(payload):
+        rows, errors = validate_batch(validate_actor)
+        if errors:
+            return batch_error(errors)
+        try:
+            inserted = insert_many(Actors, rows)
+            bump_catalog_version()
+            Actors.commit()
+        except exc.SQLAlchemyError:
+            Actors.rollback()
+            abort(422)
+        return jsonify({
+            "actors": inserted,
+            "success": True
+        })
+
+    @app.route("/movies/bulk", methods=["POST"])
+    @requires_auth('post:movies')
+    @idempotent
+    def add_movies(payload):
+        rows, errors = validate_batch(validate_movie)
+        if errors:
+            return batch_error(errors)
+        try:
+            inserted = insert_many(Movies, rows)
+            bump_catalog_version()
+            Movies.commit()
+        except exc.SQLAlchemyError:
+            Movies.rollback()
+            abort(422)
+        return jsonify({
+            "movies": inserted,
+            "success": True
+        })
+
     @app.route("/movies/cast", methods=["POST"])
     @requires_auth('post:actor_to_movie')
+    @idempotent
     def add_actor_to_movie(payload):
         try:
             movie_id = request.get_json()["movie_id"]
@@ -150,7 +747,10 @@ def create_app(test_config=None):
             # print("movie" ,movie_id)
             # print("actor",actor_id)
             relation = Relation(movie_id=movie_id, actor_id=actor_id)
-            relation.insert()
+            db.session.add(relation)
+            db.session.flush()
+            bump_catalog_version()
+            Relation.commit()
 
         except exc.IntegrityError:
             Relation.rollback()
@@ -166,41 +766,84 @@ def create_app(test_config=None):
             "success": True
         })
 
+    @app.route("/movies/cast/bulk", methods=["POST"])
+    @requires_auth('post:actor_to_movie')
+    @idempotent
+    def add_actors_to_movies(payload):
+        pairs, errors = validate_batch(validate_cast)
+        if errors:
+            return batch_error(errors)
+        pairs = list(dict.fromkeys(pairs))
+        movie_ids = {id for (id,) in db.session.query(Movies.id).filter(
+            Movies.id.in_({movie_id for movie_id, _ in pairs}))}
+        actor_ids = {id for (id,) in db.session.query(Actors.id).filter(
+            Actors.id.in_({actor_id for _, actor_id in pairs}))}
+        missing = [pair for pair in pairs
+                   if pair[0] not in movie_ids or pair[1] not in actor_ids]
+        skipped = set(missing)
+        pairs = [pair for pair in pairs if pair not in skipped]
+        try:
+            created = insert_relations(pairs)
+            if created:
+                bump_catalog_version()
+            Relation.commit()
+        except exc.IntegrityError:
+            Relation.rollback()
+            abort(409)
+        except exc.SQLAlchemyError:
+            Relation.rollback()
+            abort(422)
+
+        def as_dicts(pairs):
+            return [{"movie_id": movie_id, "actor_id": actor_id}
+                    for movie_id, actor_id in pairs]
+
+        return jsonify({
+            "created": as_dicts(pair for pair in pairs if pair in created),
+            "existing": as_dicts(
+                pair for pair in pairs if pair not in created),
+            "missing": as_dicts(missing),
+            "success": True
+        })
+
     @app.route("/actors/<id>", methods=["DELETE"])
     @requires_auth('delete:actor')
     def remove_actor(payload, id):
-
-        relation = Relation.query.filter(Relation.actor_id == id).delete()
-        actor = Actors.query.filter(Actors.id == id).one_or_none()
-        if actor:
-            actor.delete()
-        else:
-            Actors.rollback()
-            # print(sys.exc_info())
-            abort(404)
-
+        delete_rows(Actors, [id])
         return jsonify({
             "success": True,
             "actor_id": id
         })
 
+    @app.route("/actors", methods=["DELETE"])
+    @requires_auth('delete:actor')
+    def remove_actors(payload):
+        deleted, missing = delete_rows(Actors, get_ids_arg(), bulk=True)
+        return jsonify({
+            "deleted": deleted,
+            "missing": missing,
+            "success": True
+        })
+
     @app.route("/movies/<id>", methods=["DELETE"])
     @requires_auth('delete:movie')
     def remove_movie(payload, id):
-        relation = Relation.query.filter(Relation.movie_id == id).delete()
-        movie = Movies.query.filter(Movies.id == id).one_or_none()
-        if movie:
-            movie.delete()
-        else:
-            Movies.rollback()
-            # print(sys.exc_info())
-            abort(404)
-
+        delete_rows(Movies, [id])
         return jsonify({
             "success": True,
             "movie_id": id
         })
 
+    @app.route("/movies", methods=["DELETE"])
+    @requires_auth('delete:movie')
+    def remove_movies(payload):
+        deleted, missing = delete_rows(Movies, get_ids_arg(), bulk=True)
+        return jsonify({
+            "deleted": deleted,
+            "missing": missing,
+            "success": True
+        })
+
     @app.route("/movies/cast", methods=["DELETE"])
     @requires_auth('delete:actor_from_movie')
     def remove_actor_from_movie(payload):
@@ -212,7 +855,10 @@ def create_app(test_config=None):
             Relation.actor_id == aid and
             Relation.movie_id == mid).one_or_none()
         if relation:
-            relation.delete()
+            db.session.delete(relation)
+            db.session.flush()
+            bump_catalog_version()
+            Relation.commit()
         else:
             Relation.rollback()
             # print(sys.exc_info())
@@ -228,64 +874,65 @@ def create_app(test_config=None):
     @app.route("/actors/<id>", methods=["PATCH"])
     @requires_auth('patch:actor')
     def edit_actor(payload, id):
-        ans = Actors.query.filter(Actors.id == id).one_or_none()
-        # print(ans)
-        if ans is None:
-            abort(404)
-        try:
-            name = ""
-            age = ""
-            gender = ""
-            if 'name' in request.get_json():
-                name = request.get_json()['name']
-                ans.name = name
-            if 'age' in request.get_json():
-                age = request.get_json()['age']
-                ans.age = age
-            if 'gender' in request.get_json():
-                gender = request.get_json()['gender']
-                ans.gender = gender
-            name = ans.name
-            age = ans.age
-            gender = ans.gender
-            Actors.commit()
-        except:
-            Actors.rollback()
+        values, error = validate_actor(request.get_json(silent=True),
+                                       partial=True)
+        if error:
             abort(422)
+        (actor,), missing = update_rows(Actors, [(id, values)])
         return jsonify({
             "success": True,
-            "name": name,
-            "age": age,
-            "gender": gender
+            "name": actor["name"],
+            "age": actor["age"],
+            "gender": actor["gender"]
+        })
+
+    @app.route("/actors", methods=["PATCH"])
+    @requires_auth('patch:actor')
+    def edit_actors(payload):
+        updates, errors = validate_batch(validate_update(validate_actor))
+        if errors:
+            return batch_error(errors)
+        actors, missing = update_rows(Actors, updates, bulk=True)
+        return jsonify({
+            "actors": actors,
+            "missing": missing,
+            "success": True
         })
 
     @app.route("/movies/<id>", methods=["PATCH"])
     @requires_auth('patch:movie')
     def edit_movie(payload, id):
-        ans = Movies.query.filter(Movies.id == id).one_or_none()
-        if ans is None:
-            abort(404)
-        try:
-            title = ""
-            release_date = ""
-            if 'title' in request.get_json():
-                title = request.get_json()['title']
-                ans.title = title
-            if 'release_date' in request.get_json():
-                release_date = request.get_json()['release_date']
-                ans.release_date = release_date
-            title = ans.title
-            release_date = ans.release_date
-            Movies.commit()
-        except:
-            Movies.rollback()
+        values, error = validate_movie(request.get_json(silent=True),
+                                       partial=True)
+        if error:
             abort(422)
+        (movie,), missing = update_rows(Movies, [(id, values)])
         return jsonify({
             "success": True,
-            "title": title,
-            "release_date": release_date
+            "title": movie["title"],
+            "release_date": movie["release_date"]
         })
 
+    @app.route("/movies", methods=["PATCH"])
+    @requires_auth('patch:movie')
+    def edit_movies(payload):
+        updates, errors = validate_batch(validate_update(validate_movie))
+        if errors:
+            return batch_error(errors)
+        movies, missing = update_rows(Movies, updates, bulk=True)
+        return jsonify({
+            "movies": movies,
+            "missing": missing,
+            "success": True
+        })
+
+    @app.after_request
+    def invalidate_response_cache(response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and \
+                response.status_code < 400:
+            response_cache.clear()
+        return response
+
     @app.errorhandler(404)
     def error_handler_404(error):
         return jsonify({
@@ -302,6 +949,14 @@ def create_app(test_config=None):
             "error_code": 422
         }), 422
 
+    @app.errorhandler(413)
+    def error_handler_413(error):
+        return jsonify({
+            "success": False,
+            "message": "Too many items in one request",
+            "error_code": 413
+        }), 413
+
     @app.errorhandler(409)
     def error_handler_409(error):
         return jsonify({
@@ -0,0 +1,355 @@
+import os
+import time
+import asyncio
+import contextlib
+import httpx
+from a2wsgi import WSGIMiddleware
+from databases import Database
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+from flask import request as flask_request, Response as FlaskResponse
+
+# The key set is loaded and kept fresh by the event loop below, instead of
+# by the thread api.create_app would otherwise start.
+os.environ['JWKS_PRELOAD'] = 'false'
+
+import auth  # noqa
+from auth import requires_auth, parse_jwks, JWKSKeyStore  # noqa
+from api import (app as flask_app, movie_titles_query,  # noqa
+                 actor_names_query, group_names, get_view, format_rows,
+                 get_page_args, page_queries, finish_page, list_queries,
+                 after_cursor, sort_key, not_modified, body_response)
+from cache import response_cache  # noqa
+from compression import negotiate_encoding, make_compressor, entity_tag  # noqa
+from config import auth_config, api_config  # noqa
+from encoder import dumps  # noqa
+from models import Actors, Movies, CatalogVersion, database_path  # noqa
+
+
+class AsyncJWKSKeyStore(JWKSKeyStore):
+    '''JWKSKeyStore kept fresh by a task on the event loop.
+
+    The key set is fetched with httpx when the app starts and refetched
+    `refresh_margin` seconds before it expires. As with the refresher
+    thread, requests never fetch: an unknown `kid` only wakes the task.
+    '''
+
+    def __init__(self, url, **kwargs):
+        super().__init__(url, **kwargs)
+        self._task = None
+        self._loop = None
+        self._client = None
+        self._async_wake = None
+
+    @property
+    def refresher_running(self):
+        return self._task is not None and not self._task.done()
+
+    def _signal_refresh(self):
+        # get_key is called on the event loop and from the threads that
+        # serve the Flask routes.
+        self._loop.call_soon_threadsafe(self._async_wake.set)
+
+    async def refresh_async(self, force=False):
+        now = time.monotonic()
+        if not force and not self._may_refresh(now):
+            return False
+        self._last_attempt = now
+        self.fetches += 1
+        try:
+            response = await self._client.get(self.url, timeout=self.timeout)
+            response.raise_for_status()
+            keys, max_age = parse_jwks(response.content,
+                                       response.headers.get('Cache-Control'))
+        except Exception:
+            self._record_error()
+            return False
+        self._record(keys, max_age, now)
+        return True
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._async_wake = asyncio.Event()
+        self._client = httpx.AsyncClient()
+        await self.refresh_async(force=True)
+        self._task = self._loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._async_wake.wait(),
+                                       self._next_refresh_in())
+                woken = True
+            except asyncio.TimeoutError:
+                woken = False
+            self._async_wake.clear()
+            await self.refresh_async(force=not woken)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        if self._client is not None:
+            await self._client.aclose()
+
+
+def async_database_url(url):
+    # Heroku hands out postgres:// urls; the async drivers want the
+    # dialect name.
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
+
+
+database = Database(async_database_url(database_path))
+
+CAST_QUERIES = {
+    Actors: movie_titles_query,
+    Movies: actor_names_query
+}
+
+VERSION_QUERY = CatalogVersion.__table__.select().with_only_columns(
+    [CatalogVersion.version]).where(CatalogVersion.id == 1)
+
+
+def authorize(permission):
+    @requires_auth(permission)
+    def check(payload):
+        return payload
+    return check
+
+
+AUTHORIZE = {
+    Actors: authorize('get:actors'),
+    Movies: authorize('get:movies')
+}
+
+
+class Done(Exception):
+    '''Carries a finished ASGI response out of in_context.'''
+
+    def __init__(self, response):
+        self.response = response
+
+
+def in_context(request, step, *args):
+    # Runs one synchronous step of a request inside a Flask request
+    # context built from the ASGI request, so the helpers in api.py read
+    # the same arguments and headers. Nothing is awaited while the context
+    # is pushed. A step that returns a Flask response, or raises an error
+    # the Flask app's handlers render, finishes the request with it.
+    with flask_app.test_request_context(
+            request.url.path, method=request.method,
+            query_string=request.url.query,
+            headers=list(request.headers.items())):
+        try:
+            result = step(*args)
+        except Exception as error:
+            result = flask_app.make_response(
+                flask_app.handle_user_exception(error))
+        if isinstance(result, FlaskResponse):
+            raise Done(to_asgi(flask_app.process_response(result)))
+        return result
+
+
+def to_asgi(response, cls=Response, **kwargs):
+    if cls is Response:
+        kwargs['content'] = response.get_data()
+    result = cls(status_code=response.status_code, **kwargs)
+    result.raw_headers = [
+        (name.lower().encode('latin-1'), value.encode('latin-1'))
+        for name, value in response.headers.to_wsgi_list()
+        if cls is Response or name.lower() != 'content-length']
+    return result
+
+
+def row_class(model):
+    # A plain object with the model's columns and format(), which is all
+    # format_rows and sort_key need; cheaper than a mapped instance.
+    columns = tuple(column.name for column in model.__table__.columns)
+
+    def __init__(self, record):
+        for name in columns:
+            setattr(self, name, record[name])
+
+    return type(model.__name__ + 'Row', (), {
+        '__slots__': columns, '__init__': __init__, 'format': model.format})
+
+
+ROW_CLASSES = {
+    Actors: row_class(Actors),
+    Movies: row_class(Movies)
+}
+
+
+def to_instances(model, records):
+    row = ROW_CLASSES[model]
+    return [row(record) for record in records]
+
+
+async def cast_names(model, ids):
+    if not ids:
+        return {}
+    with flask_app.app_context():
+        statement = CAST_QUERIES[model](ids).statement
+    return group_names(ids, [(record[0], record[1]) for record in
+                             await database.fetch_all(statement)])
+
+
+async def format_rows_async(rows, model, view):
+    names = {}
+    if view[1]:
+        names = await cast_names(model, [row.id for row in rows])
+    return format_rows(rows, lambda ids: names, view)
+
+
+def authorize_step(model):
+    AUTHORIZE[model]()
+    return response_cache.cached_version()
+
+
+def plan_step(key, model, version):
+    response = not_modified(version)
+    if response:
+        return response
+    view = get_view(model)
+    if flask_request.args.get('stream') == 'true':
+        encoding = negotiate_encoding()
+        headers = FlaskResponse(mimetype='application/json')
+        if encoding:
+            headers.headers['Content-Encoding'] = encoding
+        headers.vary.add('Accept-Encoding')
+        headers.set_etag(entity_tag(version, encoding))
+        queries, field, descending = list_queries(model)
+        return {"stream": True, "view": view, "encoding": encoding,
+                "queries": queries, "field": field, "descending": descending,
+                "headers": flask_app.process_response(headers)}
+    cache_key = ('get_' + key,
+                 tuple(sorted(flask_request.args.items(multi=True))),
+                 version)
+    cached = response_cache.get(cache_key)
+    if cached:
+        return body_response(cache_key, cached.body, 'HIT', version)
+    limit, after = get_page_args()
+    queries, field = page_queries(model, after)
+    return {"stream": False, "view": view, "cache_key": cache_key,
+            "statements": [query.statement for query in queries],
+            "limit": limit, "field": field}
+
+
+async def fetch_page(statements, limit):
+    # The async counterpart of the reads in api.get_page: up to `limit`
+    # records from the statements in turn, each run only while the page
+    # is not full.
+    records = []
+    for statement in statements:
+        records += await database.fetch_all(
+            statement.limit(limit - len(records)))
+        if len(records) >= limit:
+            break
+    return records
+
+
+def batch_statements(model, plan, after):
+    queries = plan["queries"]
+    with flask_app.app_context():
+        if after is not None:
+            queries = after_cursor(queries, model, plan["field"],
+                                   plan["descending"], after)
+        return [query.statement for query in queries]
+
+
+async def stream_body(key, model, plan):
+    # The async counterpart of api.stream_list. The parents are read in
+    # keyset batches rather than through a cursor: the connection is the
+    # task's own, so an open iterate() would block the cast lookups.
+    batch_size = api_config['STREAM_BATCH_SIZE']
+    process = finish = None
+    if plan["encoding"]:
+        process, finish = make_compressor(plan["encoding"])
+
+    def emit(data):
+        return process(data) if process else data
+
+    yield emit(('{"success":true,"%s":[' % key).encode())
+    separator = b''
+    after = None
+    while True:
+        rows = to_instances(model, await fetch_page(
+            batch_statements(model, plan, after), batch_size))
+        if rows:
+            items = await format_rows_async(rows, model, plan["view"])
+            yield emit(separator + b','.join(dumps(item) for item in items))
+            separator = b','
+        if len(rows) < batch_size:
+            break
+        after = sort_key(rows[-1], plan["field"])
+    yield emit(b']}')
+    if finish:
+        yield finish()
+
+
+async def list_endpoint(request, key, model):
+    # The async counterpart of requires_auth plus api.list_response.
+    try:
+        version = in_context(request, authorize_step, model)
+        if version is None:
+            version = response_cache.set_version(
+                await database.fetch_val(VERSION_QUERY))
+        plan = in_context(request, plan_step, key, model, version)
+        if plan["stream"]:
+            return to_asgi(plan["headers"], StreamingResponse,
+                           content=stream_body(key, model, plan))
+        rows = to_instances(model, await fetch_page(plan["statements"],
+                                                    plan["limit"] + 1))
+        rows, next_cursor = finish_page(rows, plan["limit"], plan["field"])
+        body = dumps({
+            key: await format_rows_async(rows, model, plan["view"]),
+            "next": next_cursor,
+            "success": True
+        })
+        response_cache.put(plan["cache_key"], body, 'application/json')
+        in_context(request, body_response, plan["cache_key"], body, 'MISS',
+                   version)
+    except Done as done:
+        return done.response
+
+
+async def get_actors(request):
+    return await list_endpoint(request, 'actors', Actors)
+
+
+async def get_movies(request):
+    return await list_endpoint(request, 'movies', Movies)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    await database.connect()
+    auth.jwks_store = AsyncJWKSKeyStore(
+        auth_config['JWKS_URL'],
+        ttl=auth_config['JWKS_TTL'],
+        min_refresh_interval=auth_config['JWKS_MIN_REFRESH_INTERVAL'],
+        refresh_margin=auth_config['JWKS_REFRESH_MARGIN'])
+    await auth.jwks_store.start()
+    try:
+        yield
+    finally:
+        await auth.jwks_store.stop()
+        await database.disconnect()
+
+
+def create_asgi_app():
+    '''GET /actors and GET /movies are served on the event loop; every
+    other route is the Flask app from api.py, run in a thread pool.'''
+    return Starlette(routes=[
+        Route('/actors', get_actors, methods=['GET']),
+        Route('/movies', get_movies, methods=['GET']),
+        Mount('/', app=WSGIMiddleware(flask_app)),
+    ], lifespan=lifespan)
+
+
+app = create_asgi_app()
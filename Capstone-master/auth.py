@@ -1,14 +1,22 @@
+import os
 import json
+import re
+import hashlib
+import threading
+import time
 from flask import request, _request_ctx_stack, abort
+from collections import OrderedDict
 from functools import wraps
 from jose import jwt
 from urllib.request import urlopen
 from config import auth_config
+from metrics import request_metrics
 
 
 AUTH0_DOMAIN = auth_config['AUTH0_DOMAIN']
 ALGORITHMS = [auth_config['ALGORITHMS']]
 API_AUDIENCE = auth_config['API_AUDIENCE']
+JWKS_URL = auth_config['JWKS_URL']
 
 
 class AuthError(Exception):
@@ -17,6 +25,229 @@ class AuthError(Exception):
         self.status_code = status_code
 
 
+def parse_jwks(body, cache_control=None):
+    '''Returns the keys of a JWKS document by kid, and the max-age of its
+    Cache-Control header or None.'''
+    jwks = json.loads(body)
+    max_age = None
+    match = re.search(r'max-age=(\d+)', cache_control or '')
+    if match:
+        max_age = int(match.group(1))
+    keys = {key['kid']: key for key in jwks['keys'] if 'kid' in key}
+    return keys, max_age
+
+
+class JWKSKeyStore:
+    '''In-process cache of the signing keys published at a JWKS url.
+
+    The key set is fetched once and kept for the Cache-Control max-age of
+    the response, or for `ttl` seconds when the response has none. A token
+    with an unknown `kid` triggers a refetch, but fetches are never made
+    more often than every `min_refresh_interval` seconds. When a fetch
+    fails the last good key set keeps being served. Any url urlopen
+    understands works, so tests can point it at a file:// JWKS.
+
+    Once start_refresher() has been called a daemon thread refetches the
+    key set `refresh_margin` seconds before it expires and requests never
+    fetch themselves: an unknown `kid` only wakes the thread (still rate
+    limited) and is rejected until the new key set has arrived. The thread
+    is started again in every process forked from this one, so a key set
+    warmed in the gunicorn master is kept fresh in each worker.
+    '''
+
+    def __init__(self, url, ttl=600, min_refresh_interval=30, timeout=5,
+                 refresh_margin=60):
+        self.url = url
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.timeout = timeout
+        self.refresh_margin = refresh_margin
+        self.fetches = 0
+        self.fetch_errors = 0
+        self.consecutive_errors = 0
+        self._keys = {}
+        self._expires_at = 0
+        self._last_attempt = None
+        self._last_success = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._fork_hook = False
+
+    def _fetch(self):
+        response = urlopen(self.url, timeout=self.timeout)
+        return parse_jwks(response.read(),
+                          response.headers.get('Cache-Control'))
+
+    def refresh(self, force=False):
+        with self._lock:
+            now = time.monotonic()
+            if not force and not self._may_refresh(now):
+                return False
+            self._last_attempt = now
+            self.fetches += 1
+            try:
+                keys, max_age = self._fetch()
+            except Exception:
+                self._record_error()
+                return False
+            self._record(keys, max_age, now)
+            return True
+
+    def _may_refresh(self, now):
+        return (self._last_attempt is None or
+                now - self._last_attempt >= self.min_refresh_interval)
+
+    def _record(self, keys, max_age, now):
+        self._keys = keys
+        self._expires_at = now + (self.ttl if max_age is None else max_age)
+        self._last_success = now
+        self.consecutive_errors = 0
+
+    def _record_error(self):
+        self.fetch_errors += 1
+        self.consecutive_errors += 1
+
+    def _signal_refresh(self):
+        self._wake.set()
+
+    def get_key(self, kid):
+        if self.refresher_running:
+            key = self._keys.get(kid)
+            if key is None:
+                self._signal_refresh()
+            return key
+        if time.monotonic() >= self._expires_at:
+            self.refresh()
+        key = self._keys.get(kid)
+        if key is None and self.refresh():
+            key = self._keys.get(kid)
+        return key
+
+    @property
+    def refresher_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start_refresher(self):
+        if self.refresher_running:
+            return
+        if not self._fork_hook and hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self._after_fork)
+            self._fork_hook = True
+        self._thread = threading.Thread(target=self._run,
+                                        name='jwks-refresher', daemon=True)
+        self._thread.start()
+
+    def stop_refresher(self):
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._wake.set()
+            thread.join()
+
+    def _after_fork(self):
+        # Threads do not survive fork and the lock may have been held by
+        # one, so the child starts over with fresh ones.
+        was_running = self._thread is not None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        if was_running:
+            self.start_refresher()
+
+    def _next_refresh_in(self):
+        if self.consecutive_errors or self._last_success is None:
+            return max(self.min_refresh_interval, 1)
+        delay = self._expires_at - self.refresh_margin - time.monotonic()
+        return max(delay, 1)
+
+    def _run(self):
+        thread = threading.current_thread()
+        while self._thread is thread:
+            woken = self._wake.wait(self._next_refresh_in())
+            self._wake.clear()
+            if self._thread is not thread:
+                break
+            self.refresh(force=not woken)
+
+    def stats(self):
+        now = time.monotonic()
+        age = expires_in = None
+        if self._last_success is not None:
+            age = round(now - self._last_success, 3)
+            expires_in = round(self._expires_at - now, 3)
+        return {
+            "keys": len(self._keys),
+            "age_seconds": age,
+            "expires_in_seconds": expires_in,
+            "fetches": self.fetches,
+            "fetch_errors": self.fetch_errors,
+            "consecutive_errors": self.consecutive_errors,
+            "refresher_running": self.refresher_running}
+
+
+jwks_store = JWKSKeyStore(
+    JWKS_URL,
+    ttl=auth_config['JWKS_TTL'],
+    min_refresh_interval=auth_config['JWKS_MIN_REFRESH_INTERVAL'],
+    refresh_margin=auth_config['JWKS_REFRESH_MARGIN'])
+
+
+def warm_jwks():
+    '''Loads the key set now and keeps it fresh from a background thread.'''
+    if not jwks_store.refresher_running:
+        jwks_store.refresh(force=True)
+        jwks_store.start_refresher()
+
+
+class TokenCache:
+    '''Bounded LRU cache of verified token payloads.
+
+    Entries are keyed by the SHA-256 digest of the raw token and are
+    dropped once the token's `exp` claim has passed, so an expired token
+    always goes back through verify_decode_jwt and fails there.
+    A `maxsize` of 0 disables the cache.
+    '''
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token):
+        digest = hashlib.sha256(token.encode()).digest()
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    del self._entries[digest]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, token, payload):
+        if self.maxsize <= 0 or 'exp' not in payload:
+            return
+        digest = hashlib.sha256(token.encode()).digest()
+        with self._lock:
+            self._entries[digest] = (payload['exp'], payload)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+token_cache = TokenCache(auth_config['TOKEN_CACHE_SIZE'])
+
+
 def get_token_auth_header():
     if 'Authorization' not in request.headers:
         raise AuthError({
@@ -47,9 +278,6 @@ def check_permissions(permission, payload):
 
 
 def verify_decode_jwt(token):
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
-
     # GET THE DATA IN THE HEADER
     unverified_header = jwt.get_unverified_header(token)
 
@@ -62,15 +290,15 @@ def verify_decode_jwt(token):
             'description': 'Authorization malformed.'
         }, 401)
 
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+    key = jwks_store.get_key(unverified_header['kid'])
+    if key:
+        rsa_key = {
+            'kty': key['kty'],
+            'kid': key['kid'],
+            'use': key['use'],
+            'n': key['n'],
+            'e': key['e']
+        }
 
     if rsa_key:
         try:
@@ -112,9 +340,13 @@ def requires_auth(permission=''):
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
-            token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
+            with request_metrics.phase('auth'):
+                token = get_token_auth_header()
+                payload = token_cache.get(token)
+                if payload is None:
+                    payload = verify_decode_jwt(token)
+                    token_cache.put(token, payload)
+                check_permissions(permission, payload)
             return f(payload, *args, **kwargs)
 
         return wrapper
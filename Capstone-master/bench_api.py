@@ -0,0 +1,252 @@
+import os
+import json
+import time
+import argparse
+import datetime
+
+parser = argparse.ArgumentParser(
+    description="Throughput and p50/p95/p99 latency of every route, "
+                "through create_app with a local database and a stub "
+                "JWKS served from a locally generated RSA key.")
+parser.add_argument('--count', type=int, default=1000,
+                    help="actors and movies to seed")
+parser.add_argument('--cast', type=int, default=5,
+                    help="movies per actor")
+parser.add_argument('--requests', type=int, default=200,
+                    help="timed requests per route")
+parser.add_argument('--warmup', type=int, default=10,
+                    help="untimed requests per route")
+parser.add_argument('--routes', default=None,
+                    help="comma separated route names to run (default all)")
+parser.add_argument('--database', default=None,
+                    help="database url (defaults to a temporary sqlite file)")
+parser.add_argument('--output', default=None,
+                    help="write the JSON results to this file")
+parser.add_argument('--accept-encoding', default=None,
+                    help="Accept-Encoding header to send, e.g. gzip")
+parser.add_argument('--baseline', default=None,
+                    help="JSON results of an earlier run to compare with")
+args = parser.parse_args()
+
+# config.py reads these at import; none of them reach the network here.
+for name, value in (('AUTH0_DOMAIN_NAME', 'bench.local'),
+                    ('API_AUDIENCE', 'casting'),
+                    ('CLIENT_ID', 'bench'),
+                    ('CALLBACK_URL', 'http://localhost'),
+                    ('CASTING_ASSISTANT', ''),
+                    ('CASTING_DIRECTOR', ''),
+                    ('EXECUTIVE_DIRECTOR', '')):
+    os.environ.setdefault(name, value)
+# The key set is warmed below, from the stub, instead of at import.
+os.environ['JWKS_PRELOAD'] = 'false'
+
+from stub_auth import generate_key, sign_token, StubJWKSServer  # noqa
+from bench_data import use_database, seed  # noqa
+
+jwk, pem = generate_key("bench")
+jwks_server = StubJWKSServer([jwk])
+path = use_database(args.database)
+
+import auth  # noqa
+from api import app  # noqa
+from models import db, insert_many, Actors, Movies, Relation  # noqa
+from cache import response_cache  # noqa
+
+auth.jwks_store = auth.JWKSKeyStore(jwks_server.url)
+auth.warm_jwks()
+
+PERMISSIONS = ['get:actors', 'get:movies', 'post:actors', 'post:movies',
+               'post:actor_to_movie', 'patch:actor', 'patch:movie',
+               'delete:actor', 'delete:movie', 'delete:actor_from_movie']
+
+
+def new_actors(count):
+    rows = insert_many(Actors, [
+        {"name": "bench actor", "age": 40, "gender": "male"}
+        for i in range(count)])
+    return [row['id'] for row in rows]
+
+
+def new_movies(count):
+    rows = insert_many(Movies, [
+        {"title": "bench movie", "release_date": datetime.date(2020, 1, 1)}
+        for i in range(count)])
+    return [row['id'] for row in rows]
+
+
+def targets(create):
+    '''Makes rows before the route runs and hands out one id per request.'''
+    def setup(count):
+        ids = create(count)
+        db.session.commit()
+        return iter(ids)
+    return setup
+
+
+def ids_arg(ids, count):
+    return ','.join(str(next(ids)) for i in range(count))
+
+
+def cast_targets(count):
+    pairs = list(zip(new_movies(count), new_actors(count)))
+    db.session.bulk_insert_mappings(Relation, [
+        {"movie_id": movie_id, "actor_id": actor_id}
+        for movie_id, actor_id in pairs])
+    db.session.commit()
+    return iter(pairs)
+
+
+def uncached():
+    response_cache.clear()
+
+
+def actor_body(i):
+    return {"name": "actor %d" % i, "age": 30, "gender": "female"}
+
+
+def movie_body(i):
+    return {"title": "movie %d" % i, "release_date": "01/01/2020"}
+
+
+# (name, method, setup, request, prepare): setup(n) runs once and returns
+# state, request(i, state) returns (url, json body), and prepare runs
+# untimed before every request. Routes that write run after the reads.
+ROUTES = [
+    ("home", "GET", None, lambda i, s: ("/", None), None),
+    ("authorization", "GET", None,
+     lambda i, s: ("/authorization", None), None),
+    ("get_actors_cached", "GET", None,
+     lambda i, s: ("/actors", None), None),
+    ("get_actors", "GET", None, lambda i, s: ("/actors", None), uncached),
+    ("get_actors_filtered", "GET", None,
+     lambda i, s: ("/actors?name=actor%201&sort=name", None), uncached),
+    ("get_actors_stream", "GET", None,
+     lambda i, s: ("/actors?stream=true", None), uncached),
+    ("get_movies_cached", "GET", None,
+     lambda i, s: ("/movies", None), None),
+    ("get_movies", "GET", None, lambda i, s: ("/movies", None), uncached),
+    ("get_movies_stream", "GET", None,
+     lambda i, s: ("/movies?stream=true", None), uncached),
+    ("post_actor", "POST", None,
+     lambda i, s: ("/actors", actor_body(i)), None),
+    ("post_movie", "POST", None,
+     lambda i, s: ("/movies", movie_body(i)), None),
+    ("post_actors_bulk", "POST", None,
+     lambda i, s: ("/actors/bulk", [actor_body(i)] * 10), None),
+    ("post_movies_bulk", "POST", None,
+     lambda i, s: ("/movies/bulk", [movie_body(i)] * 10), None),
+    ("post_cast", "POST", targets(new_actors),
+     lambda i, s: ("/movies/cast", {"movie_id": 1, "actor_id": next(s)}),
+     None),
+    ("post_cast_bulk", "POST", targets(new_actors),
+     lambda i, s: ("/movies/cast/bulk", [
+         {"movie_id": movie_id, "actor_id": next(s)}
+         for movie_id in range(1, 11)]), None),
+    ("patch_actor", "PATCH", None,
+     lambda i, s: ("/actors/%d" % (i % args.count + 1), {"age": 50}),
+     None),
+    ("patch_movie", "PATCH", None,
+     lambda i, s: ("/movies/%d" % (i % args.count + 1),
+                   {"release_date": "02/02/2002"}), None),
+    ("patch_actors_bulk", "PATCH", None,
+     lambda i, s: ("/actors", [{"id": (i * 10 + j) % args.count + 1,
+                                "age": 50} for j in range(10)]), None),
+    ("patch_movies_bulk", "PATCH", None,
+     lambda i, s: ("/movies", [{"id": (i * 10 + j) % args.count + 1,
+                                "title": "movie %d" % j}
+                               for j in range(10)]), None),
+    ("delete_cast", "DELETE", cast_targets,
+     lambda i, s: ("/movies/cast?movieid=%d&actorid=%d" % next(s), None),
+     None),
+    ("delete_actor", "DELETE", targets(new_actors),
+     lambda i, s: ("/actors/%d" % next(s), None), None),
+    ("delete_movie", "DELETE", targets(new_movies),
+     lambda i, s: ("/movies/%d" % next(s), None), None),
+    ("delete_actors_bulk", "DELETE",
+     targets(lambda count: new_actors(count * 10)),
+     lambda i, s: ("/actors?ids=" + ids_arg(s, 10), None), None),
+    ("delete_movies_bulk", "DELETE",
+     targets(lambda count: new_movies(count * 10)),
+     lambda i, s: ("/movies?ids=" + ids_arg(s, 10), None), None),
+]
+
+
+def percentile(ordered, fraction):
+    index = max(int(round(fraction * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def run(client, headers, method, setup, make_request, prepare):
+    total = args.warmup + args.requests
+    state = None
+    if setup is not None:
+        with app.app_context():
+            state = setup(total * 10 if method == "POST" else total)
+    latencies = []
+    status = {}
+    for i in range(total):
+        url, body = make_request(i, state)
+        if prepare is not None:
+            prepare()
+        start = time.perf_counter()
+        res = client.open(url, method=method, json=body, headers=headers)
+        res.get_data()
+        elapsed = time.perf_counter() - start
+        if i < args.warmup:
+            continue
+        latencies.append(elapsed)
+        status[res.status_code] = status.get(res.status_code, 0) + 1
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": sum(n for code, n in status.items() if code >= 400),
+        "status": {str(code): n for code, n in sorted(status.items())},
+        "rps": round(len(latencies) / sum(latencies), 1),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 3),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3)}
+
+
+def compare(results, baseline):
+    for name, result in results["routes"].items():
+        before = baseline["routes"].get(name)
+        if before:
+            result["p95_change"] = round(
+                result["p95_ms"] / before["p95_ms"] - 1, 3)
+            result["rps_change"] = round(result["rps"] / before["rps"] - 1, 3)
+
+
+def main():
+    selected = args.routes.split(',') if args.routes else None
+    results = {"count": args.count, "cast": args.cast,
+               "requests": args.requests,
+               "database": db.engine.dialect.name, "routes": {}}
+    token = sign_token(pem, "bench", PERMISSIONS)
+    headers = {"Authorization": "Bearer " + token}
+    if args.accept_encoding:
+        headers["Accept-Encoding"] = args.accept_encoding
+    client = app.test_client()
+    try:
+        with app.app_context():
+            seed(args.count, args.cast)
+        for name, method, setup, make_request, prepare in ROUTES:
+            if selected is None or name in selected:
+                results["routes"][name] = run(client, headers, method, setup,
+                                              make_request, prepare)
+        if args.baseline:
+            with open(args.baseline) as f:
+                compare(results, json.load(f))
+        output = json.dumps(results, indent=2)
+        if args.output:
+            with open(args.output, 'w') as f:
+                f.write(output + '\n')
+        print(output)
+    finally:
+        jwks_server.close()
+        if path:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+import httpx
+
+parser = argparse.ArgumentParser(
+    description="Throughput and latency of one list route as concurrency "
+                "grows, served by gunicorn with the sync Flask app "
+                "(api:app) and by uvicorn with the async edition "
+                "(asgi:app), against the same local database and stub JWKS.")
+parser.add_argument('--path', default='/movies?limit=100')
+parser.add_argument('--concurrency', default='1,8,32,64')
+parser.add_argument('--requests', type=int, default=500,
+                    help="requests per concurrency level")
+parser.add_argument('--workers', type=int, default=1,
+                    help="worker processes for both servers")
+parser.add_argument('--count', type=int, default=1000)
+parser.add_argument('--cast', type=int, default=5)
+parser.add_argument('--cache', action='store_true',
+                    help="keep the response cache on (off by default, so "
+                         "every request reaches the database)")
+parser.add_argument('--database', default=None,
+                    help="database url (defaults to a temporary sqlite file)")
+args = parser.parse_args()
+
+for name, value in (('AUTH0_DOMAIN_NAME', 'bench.local'),
+                    ('API_AUDIENCE', 'casting'),
+                    ('CLIENT_ID', 'bench'),
+                    ('CALLBACK_URL', 'http://localhost'),
+                    ('CASTING_ASSISTANT', ''),
+                    ('CASTING_DIRECTOR', ''),
+                    ('EXECUTIVE_DIRECTOR', '')):
+    os.environ.setdefault(name, value)
+os.environ['JWKS_PRELOAD'] = 'false'
+
+from stub_auth import generate_key, sign_token, StubJWKSServer  # noqa
+from bench_data import use_database, seed  # noqa
+
+jwk, pem = generate_key("bench")
+jwks_server = StubJWKSServer([jwk])
+path = use_database(args.database)
+
+SERVERS = {
+    "sync": ['gunicorn', '--workers', str(args.workers), '--bind',
+             '127.0.0.1:{port}', 'api:app'],
+    "async": ['uvicorn', '--workers', str(args.workers), '--host',
+              '127.0.0.1', '--port', '{port}', '--log-level', 'warning',
+              'asgi:app'],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def server_env():
+    env = dict(os.environ, JWKS_URL=jwks_server.url, JWKS_PRELOAD='true')
+    if not args.cache:
+        env['RESPONSE_CACHE_BYTES'] = '0'
+    return env
+
+
+def start(name):
+    port = free_port()
+    command = [part.format(port=port) for part in SERVERS[name]]
+    bin_dir = os.path.dirname(sys.executable)
+    command[0] = os.path.join(bin_dir, command[0])
+    process = subprocess.Popen(command, env=server_env(),
+                               cwd=os.path.dirname(os.path.abspath(
+                                   __file__)))
+    url = 'http://127.0.0.1:{}'.format(port)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url + '/').status_code == 200:
+                return process, url
+        except httpx.TransportError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError(name + " server did not start")
+
+
+def percentile(ordered, fraction):
+    index = max(int(round(fraction * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+async def load(url, headers, concurrency):
+    latencies = []
+    errors = 0
+    remaining = iter(range(args.requests))
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async def user(client):
+        nonlocal errors
+        for i in remaining:
+            start = time.perf_counter()
+            res = await client.get(url + args.path, headers=headers)
+            latencies.append(time.perf_counter() - start)
+            if res.status_code != 200:
+                errors += 1
+
+    async with httpx.AsyncClient(limits=limits, timeout=60) as client:
+        await client.get(url + args.path, headers=headers)
+        start = time.perf_counter()
+        await asyncio.gather(*(user(client) for i in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {"rps": round(len(latencies) / elapsed, 1), "errors": errors,
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2)}
+
+
+def main():
+    from api import app
+    with app.app_context():
+        seed(args.count, args.cast)
+    token = sign_token(pem, "bench", ['get:actors', 'get:movies'])
+    headers = {"Authorization": "Bearer " + token}
+    results = {"path": args.path, "workers": args.workers,
+               "requests": args.requests, "count": args.count,
+               "database": args.database or "sqlite"}
+    try:
+        for name in SERVERS:
+            process, url = start(name)
+            try:
+                results[name] = {
+                    level: asyncio.run(load(url, headers, int(level)))
+                    for level in args.concurrency.split(',')}
+            finally:
+                process.terminate()
+                process.wait()
+        print(json.dumps(results, indent=2))
+    finally:
+        jwks_server.close()
+        if path:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+import os
+import json
+import time
+import argparse
+import tempfile
+from flask import Flask, jsonify
+import auth
+from auth import requires_auth, JWKSKeyStore, TokenCache
+from stub_auth import generate_key, sign_token
+
+
+def build_app():
+    app = Flask(__name__)
+
+    @app.route("/actors")
+    @requires_auth('get:actors')
+    def get_actors(payload):
+        return jsonify({"actors": [], "success": True})
+
+    return app
+
+
+def run(client, token, requests):
+    head = {"Authorization": "Bearer " + token}
+    start = time.perf_counter()
+    for i in range(requests):
+        res = client.get('/actors', headers=head)
+        assert res.status_code == 200
+    return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Requests per second through requires_auth with and "
+                    "without the verified-token cache.")
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--bits', type=int, default=2048)
+    args = parser.parse_args()
+
+    jwk, pem = generate_key("bench", args.bits)
+    fd, path = tempfile.mkstemp(suffix='.json')
+    with os.fdopen(fd, 'w') as f:
+        json.dump({"keys": [jwk]}, f)
+    auth.jwks_store = JWKSKeyStore('file://' + path)
+    token = sign_token(pem, "bench", ["get:actors"])
+    client = build_app().test_client()
+
+    try:
+        results = {}
+        for name, size in (("uncached", 0), ("cached", 1024)):
+            auth.token_cache = TokenCache(size)
+            results[name] = {
+                "requests_per_second": round(
+                    run(client, token, args.requests), 1),
+                "hits": auth.token_cache.hits,
+                "misses": auth.token_cache.misses}
+        results["speedup"] = round(
+            results["cached"]["requests_per_second"] /
+            results["uncached"]["requests_per_second"], 2)
+        print(json.dumps(results, indent=2))
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+import os
+import json
+import time
+import argparse
+from bench_data import use_database, seed
+
+parser = argparse.ArgumentParser(
+    description="Time to build the full actor and movie lists with the "
+                "original row-per-cast outer join versus one query for "
+                "the parents plus one batched IN query for the cast.")
+parser.add_argument('--count', type=int, default=2000)
+parser.add_argument('--cast', type=int, default=30,
+                    help="movies per actor")
+parser.add_argument('--repeat', type=int, default=5)
+parser.add_argument('--database', default=None,
+                    help="database url (defaults to a temporary sqlite file)")
+args = parser.parse_args()
+
+path = use_database(args.database)
+
+from api import (app, format_with_cast, movie_titles_by_actor,  # noqa
+                 actor_names_by_movie)
+from models import db, Actors, Movies, Relation  # noqa
+
+
+# The loader GET /actors and GET /movies used before the batched one.
+def conv_actor_list_to_dict(actors_list):
+    dict_of_actors = {}
+    for actor in actors_list:
+        if actor[0] not in dict_of_actors:
+            if actor[1]:
+                dict_of_actors[actor[0]] = [actor[1].title]
+            else:
+                dict_of_actors[actor[0]] = []
+        else:
+            dict_of_actors[actor[0]].append(actor[1].title)
+    return dict_of_actors
+
+
+def conv_movie_list_to_dict(movies_list):
+    dict_of_movies = {}
+    for movie in movies_list:
+        if movie[0] not in dict_of_movies:
+            if movie[1]:
+                dict_of_movies[movie[0]] = [movie[1].name]
+            else:
+                dict_of_movies[movie[0]] = []
+        else:
+            dict_of_movies[movie[0]].append(movie[1].name)
+    return dict_of_movies
+
+
+def join_actors():
+    list_of_actors = db.session.query(Actors, Movies).outerjoin(
+        Relation, Relation.actor_id == Actors.id).outerjoin(
+        Movies, Relation.movie_id == Movies.id).order_by(Actors.id).all()
+    dict_of_actors = conv_actor_list_to_dict(list_of_actors)
+    return [actor.format(dict_of_actors[actor]) for actor in dict_of_actors]
+
+
+def join_movies():
+    list_of_movies = db.session.query(Movies, Actors).outerjoin(
+        Relation, Relation.movie_id == Movies.id).outerjoin(
+        Actors, Relation.actor_id == Actors.id).order_by(Movies.id).all()
+    dict_of_movies = conv_movie_list_to_dict(list_of_movies)
+    return [movie.format(dict_of_movies[movie]) for movie in dict_of_movies]
+
+
+def batched_actors():
+    actors = Actors.query.order_by(Actors.id).all()
+    return format_with_cast(actors, movie_titles_by_actor)
+
+
+def batched_movies():
+    movies = Movies.query.order_by(Movies.id).all()
+    return format_with_cast(movies, actor_names_by_movie)
+
+
+def measure(loader):
+    best = None
+    for i in range(args.repeat):
+        db.session.remove()
+        start = time.perf_counter()
+        items = loader()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return items, round(best * 1000, 1)
+
+
+def main():
+    results = {"count": args.count, "cast": args.cast}
+    try:
+        with app.app_context():
+            seed(args.count, args.cast)
+            for name, cast, baseline, loader in (
+                    ("actors", "movies", join_actors, batched_actors),
+                    ("movies", "actors", join_movies, batched_movies)):
+                expected, join_ms = measure(baseline)
+                items, batched_ms = measure(loader)
+                assert [(item['id'], sorted(item[cast])) for item in items] \
+                    == [(item['id'], sorted(item[cast]))
+                        for item in expected]
+                results[name] = {"join_ms": join_ms,
+                                 "batched_ms": batched_ms}
+        print(json.dumps(results, indent=2))
+    finally:
+        if path:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+import os
+import datetime
+import tempfile
+
+
+def use_database(database=None):
+    '''Points models.py at `database`, or at a fresh sqlite file.
+
+    Must run before api or models is imported. The tables are created on
+    startup unless DB_CREATE_ALL says otherwise. Returns the path of the
+    sqlite file to remove afterwards, or None.
+    '''
+    path = None
+    if database is None:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        database = 'sqlite:///' + path
+    os.environ['DATABASE_URL'] = database
+    if os.environ.setdefault('DB_CREATE_ALL', 'true') == 'true':
+        # config.py may have been imported already, e.g. by another test
+        # module of the same run; servers started from here read the
+        # environment.
+        from config import db_config
+        db_config['CREATE_ALL'] = True
+    return path
+
+
+def seed(count, cast):
+    '''Replaces the catalog with `count` actors and movies and `cast`
+    movies per actor.'''
+    from models import db, Actors, Movies, Relation
+    db.session.query(Relation).delete()
+    db.session.query(Actors).delete()
+    db.session.query(Movies).delete()
+    db.session.bulk_insert_mappings(Actors, [
+        {"id": i, "name": "actor %d" % i, "age": 30, "gender": "female"}
+        for i in range(1, count + 1)])
+    db.session.bulk_insert_mappings(Movies, [
+        {"id": i, "title": "movie %d" % i,
+         "release_date": datetime.date(2000, 1, 1)}
+        for i in range(1, count + 1)])
+    db.session.bulk_insert_mappings(Relation, [
+        {"actor_id": i, "movie_id": (i + j) % count + 1}
+        for i in range(1, count + 1) for j in range(min(cast, count))])
+    db.session.commit()
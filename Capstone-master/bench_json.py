@@ -0,0 +1,57 @@
+import json
+import time
+import argparse
+import datetime
+from flask import Flask, jsonify
+from encoder import ENCODERS
+
+parser = argparse.ArgumentParser(
+    description="Time to serialize a /movies payload with Flask's jsonify "
+                "(the previous encoder) and with each encoder in encoder.py.")
+parser.add_argument('--sizes', default='1000,10000,50000',
+                    help="movies per payload")
+parser.add_argument('--cast', type=int, default=10,
+                    help="actor names per movie")
+parser.add_argument('--repeat', type=int, default=5)
+args = parser.parse_args()
+
+
+def payload(count):
+    return {
+        "movies": [{"id": i, "title": "movie %d" % i,
+                    "release_date": datetime.date(2000, 1, 1) +
+                    datetime.timedelta(days=i % 7000),
+                    "actors": ["actor %d" % (i + j)
+                               for j in range(args.cast)]}
+                   for i in range(1, count + 1)],
+        "next": None,
+        "success": True}
+
+
+def measure(encode, data):
+    best = None
+    for i in range(args.repeat):
+        start = time.perf_counter()
+        body = encode(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return {"ms": round(best * 1000, 2), "bytes": len(body)}
+
+
+def main():
+    app = Flask(__name__)
+    results = []
+    with app.app_context():
+        for count in [int(size) for size in args.sizes.split(',')]:
+            data = payload(count)
+            result = {"movies": count,
+                      "jsonify": measure(
+                          lambda data: jsonify(data).get_data(), data)}
+            for name, dumps in ENCODERS.items():
+                result[name] = measure(dumps, data)
+            results.append(result)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import subprocess
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+parser = argparse.ArgumentParser(
+    description="Startup time and first-request latency of the bare "
+                "`gunicorn api:app` from before the production profile and "
+                "of `gunicorn --config gunicorn_prod.py api:app`, each "
+                "started fresh `--runs` times against the same local "
+                "database and stub JWKS.")
+parser.add_argument('--runs', type=int, default=5)
+parser.add_argument('--workers', type=int, default=2,
+                    help="WEB_CONCURRENCY for both setups")
+parser.add_argument('--worker-class', default='gthread',
+                    help="worker class for the production profile")
+parser.add_argument('--burst', type=int, default=8,
+                    help="concurrent requests sent right after the first one")
+parser.add_argument('--path', default='/movies?limit=20')
+parser.add_argument('--count', type=int, default=200)
+parser.add_argument('--jwks-delay', type=float, default=0.1,
+                    help="seconds the stub JWKS takes to answer")
+parser.add_argument('--database', default=None,
+                    help="database url (defaults to a temporary sqlite file)")
+args = parser.parse_args()
+
+for name, value in (('AUTH0_DOMAIN_NAME', 'bench.local'),
+                    ('API_AUDIENCE', 'casting'),
+                    ('CLIENT_ID', 'bench'),
+                    ('CALLBACK_URL', 'http://localhost'),
+                    ('CASTING_ASSISTANT', ''),
+                    ('CASTING_DIRECTOR', ''),
+                    ('EXECUTIVE_DIRECTOR', '')):
+    os.environ.setdefault(name, value)
+os.environ['JWKS_PRELOAD'] = 'false'
+
+from stub_auth import generate_key, sign_token, StubJWKSServer  # noqa
+from bench_data import use_database, seed  # noqa
+
+jwk, pem = generate_key("bench")
+jwks_server = StubJWKSServer([jwk])
+path = use_database(args.database)
+
+SETUPS = {
+    "bare": ['gunicorn', '--bind', '127.0.0.1:{port}', 'api:app'],
+    "production": ['gunicorn', '--config', 'gunicorn_prod.py',
+                   '--worker-class', args.worker_class,
+                   '--bind', '127.0.0.1:{port}', 'api:app'],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def get(port, headers):
+    start = time.perf_counter()
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    try:
+        connection.request('GET', args.path, headers=headers)
+        response = connection.getresponse()
+        response.read()
+    finally:
+        connection.close()
+    if response.status != 200:
+        raise RuntimeError('{} answered {}'.format(args.path,
+                                                   response.status))
+    return time.perf_counter() - start
+
+
+def run(name, headers):
+    port = free_port()
+    command = [part.format(port=port) for part in SETUPS[name]]
+    command[0] = os.path.join(os.path.dirname(sys.executable), command[0])
+    env = dict(os.environ, JWKS_URL=jwks_server.url, JWKS_PRELOAD='true',
+               WEB_CONCURRENCY=str(args.workers))
+    started = time.perf_counter()
+    process = subprocess.Popen(command, env=env, stderr=subprocess.DEVNULL,
+                               cwd=os.path.dirname(os.path.abspath(__file__)))
+    try:
+        # The master accepts connections once it is listening; the first
+        # request then waits for a worker to be ready to take it.
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), 0.1).close()
+                break
+            except OSError:
+                if process.poll() is not None or \
+                        time.perf_counter() - started > 60:
+                    raise RuntimeError(name + " server did not start")
+                time.sleep(0.01)
+        first = get(port, headers)
+        first_response = time.perf_counter() - started
+        with ThreadPoolExecutor(args.burst) as pool:
+            cold = list(pool.map(lambda i: get(port, headers),
+                                 range(args.burst)))
+            warm = list(pool.map(lambda i: get(port, headers),
+                                 range(args.burst * 4)))
+    finally:
+        process.terminate()
+        process.wait()
+    return {"first_response_s": first_response,
+            "first_request_ms": first * 1000,
+            "burst_max_ms": max(cold) * 1000,
+            "warm_p50_ms": statistics.median(warm) * 1000}
+
+
+def main():
+    from api import app
+    with app.app_context():
+        seed(args.count, 3)
+    token = sign_token(pem, "bench", ['get:actors', 'get:movies'])
+    headers = {"Authorization": "Bearer " + token}
+    jwks_server.delay = args.jwks_delay
+    results = {"path": args.path, "workers": args.workers,
+               "worker_class": args.worker_class, "runs": args.runs,
+               "jwks_delay": args.jwks_delay,
+               "database": args.database or "sqlite"}
+    try:
+        for name in SETUPS:
+            runs = [run(name, headers) for i in range(args.runs)]
+            results[name] = {
+                measure: round(statistics.median(
+                    result[measure] for result in runs), 3)
+                for measure in runs[0]}
+        print(json.dumps(results, indent=2))
+    finally:
+        jwks_server.close()
+        if path:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
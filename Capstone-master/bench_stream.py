@@ -0,0 +1,65 @@
+import os
+import json
+import argparse
+import tracemalloc
+from bench_data import use_database, seed
+
+parser = argparse.ArgumentParser(
+    description="Peak memory of a full /actors listing, built in memory "
+                "with jsonify versus streamed with ?stream=true.")
+parser.add_argument('--sizes', default='1000,5000,20000')
+parser.add_argument('--cast', type=int, default=5,
+                    help="movies per actor")
+parser.add_argument('--database', default=None,
+                    help="database url (defaults to a temporary sqlite file)")
+args = parser.parse_args()
+
+path = use_database(args.database)
+
+from api import (app, format_with_cast, movie_titles_by_actor,  # noqa
+                 stream_response)
+from flask import jsonify  # noqa
+from models import db, Actors  # noqa
+
+
+def buffered():
+    actors = Actors.query.order_by(Actors.id).all()
+    list_of_actors = format_with_cast(actors, movie_titles_by_actor)
+    return len(jsonify({"actors": list_of_actors,
+                        "success": True}).get_data())
+
+
+def streamed():
+    response = stream_response('actors', Actors, movie_titles_by_actor,
+                               (['id', 'name', 'age', 'gender'], 'movies'))
+    return sum(len(chunk) for chunk in response.response)
+
+
+def measure(mode):
+    with app.test_request_context('/actors'):
+        db.session.expunge_all()
+        tracemalloc.start()
+        size = mode()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        db.session.remove()
+    return {"bytes": size, "peak_kib": round(peak / 1024, 1)}
+
+
+def main():
+    results = []
+    try:
+        for count in [int(size) for size in args.sizes.split(',')]:
+            with app.app_context():
+                seed(count, args.cast)
+            results.append({"actors": count,
+                            "buffered": measure(buffered),
+                            "streamed": measure(streamed)})
+        print(json.dumps(results, indent=2))
+    finally:
+        if path:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
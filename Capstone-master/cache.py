@@ -0,0 +1,115 @@
+import time
+import threading
+from collections import OrderedDict, namedtuple
+from config import api_config
+
+
+CachedResponse = namedtuple('CachedResponse',
+                            ['body', 'mimetype', 'encoded'])
+
+
+def entry_size(entry):
+    return len(entry.body) + sum(len(body) for body in entry.encoded.values())
+
+
+class ResponseCache:
+    '''Bounded LRU cache of serialized list responses.
+
+    Entries are evicted least recently used first once the cached bodies
+    add up to more than `maxbytes`; a `maxbytes` of 0 disables the cache.
+    Keys include the catalog version, so entries written before a write on
+    another worker simply stop being looked up. The version itself is
+    remembered for `version_ttl` seconds, which bounds how long a write
+    made by another worker can go unnoticed. A version read from a replica
+    is remembered apart from the primary's (`bind`), so the two never mix.
+    Compressed copies of a body are kept on its entry and count towards
+    `maxbytes` with it.
+    '''
+
+    def __init__(self, maxbytes, version_ttl=1.0):
+        self.maxbytes = maxbytes
+        self.version_ttl = version_ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def current_version(self, load, bind=None):
+        version = self.cached_version(bind)
+        if version is None:
+            version = self.set_version(load(), bind)
+        return version
+
+    def cached_version(self, bind=None):
+        version, expires_at = self._versions.get(bind, (None, 0))
+        if time.monotonic() >= expires_at:
+            return None
+        return version
+
+    def set_version(self, version, bind=None):
+        self._versions[bind] = (version,
+                                time.monotonic() + self.version_ttl)
+        return version
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, mimetype):
+        if len(body) > self.maxbytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= entry_size(old)
+            self._entries[key] = CachedResponse(body, mimetype, {})
+            self.size += len(body)
+            self._evict()
+
+    def get_encoded(self, key, encoding):
+        entry = self._entries.get(key)
+        return entry.encoded.get(encoding) if entry is not None else None
+
+    def put_encoded(self, key, encoding, body):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or encoding in entry.encoded:
+                return
+            entry.encoded[encoding] = body
+            self.size += len(body)
+            self._evict()
+
+    def _evict(self):
+        while self.size > self.maxbytes:
+            evicted = self._entries.popitem(last=False)[1]
+            self.size -= entry_size(evicted)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            self._versions = {}
+
+    @property
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def stats(self):
+        return {"entries": len(self._entries), "bytes": self.size,
+                "hits": self.hits, "misses": self.misses,
+                "evictions": self.evictions, "hit_ratio": self.hit_ratio}
+
+
+response_cache = ResponseCache(api_config['RESPONSE_CACHE_BYTES'],
+                               api_config['CATALOG_VERSION_TTL'])
@@ -0,0 +1,59 @@
+import zlib
+import gzip
+from flask import request
+from config import api_config
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Offered in order of preference when the client rates them equally.
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def negotiate_encoding(size=None):
+    '''Returns the Content-Encoding to answer the current request with,
+    or None to send the body as is.
+
+    Bodies smaller than COMPRESSION_MIN_BYTES are not worth compressing;
+    a `size` of None (a streamed body) always is.
+    '''
+    if not api_config['COMPRESSION']:
+        return None
+    if size is not None and size < api_config['COMPRESSION_MIN_BYTES']:
+        return None
+    return request.accept_encodings.best_match(ENCODINGS)
+
+
+def entity_tag(version, encoding=None):
+    # Each encoding of a body is a representation of its own, so it gets
+    # a strong ETag of its own.
+    return '%s-%s' % (version, encoding) if encoding else str(version)
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=api_config['BROTLI_QUALITY'])
+    return gzip.compress(body, compresslevel=api_config['GZIP_LEVEL'])
+
+
+def make_compressor(encoding):
+    '''Returns (process, finish) functions of an incremental compressor.'''
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=api_config['BROTLI_QUALITY'])
+        return compressor.process, compressor.finish
+    # wbits 31 writes a gzip header and trailer around the deflate data.
+    compressor = zlib.compressobj(api_config['GZIP_LEVEL'],
+                                  zlib.DEFLATED, 31)
+    return compressor.compress, compressor.flush
+
+
+def compress_stream(chunks, encoding):
+    process, finish = make_compressor(encoding)
+    for chunk in chunks:
+        data = process(chunk)
+        if data:
+            yield data
+    yield finish()
@@ -6,6 +6,21 @@ database = {
     "port": "localhost:5432"
 }
 
+db_config = {
+    'POOL_SIZE': int(os.environ.get('DB_POOL_SIZE', 5)),
+    'MAX_OVERFLOW': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+    'POOL_PRE_PING': os.environ.get('DB_POOL_PRE_PING', 'true') == 'true',
+    'POOL_RECYCLE': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+    'POOL_TIMEOUT': int(os.environ.get('DB_POOL_TIMEOUT', 30)),
+    # Deployments get the schema from the migrations (see manage.py);
+    # the tests and benchmarks turn this on for their scratch databases.
+    'CREATE_ALL': os.environ.get('DB_CREATE_ALL', 'false') == 'true',
+    'READ_YOUR_WRITES': float(os.environ.get('READ_YOUR_WRITES', 5)),
+    'REPLICA_MAX_LAG': float(os.environ.get('REPLICA_MAX_LAG', 5)),
+    'REPLICA_CHECK_INTERVAL': float(
+        os.environ.get('REPLICA_CHECK_INTERVAL', 1))
+}
+
 Authtoken = {
  'casting_assistant': os.environ['CASTING_ASSISTANT'],
  'casting_director': os.environ['CASTING_DIRECTOR'],
@@ -17,5 +32,43 @@ auth_config = {
     'ALGORITHMS': 'RS256',
     'API_AUDIENCE': os.environ['API_AUDIENCE'],
     'AUTH0_CLIENT_ID': os.environ['CLIENT_ID'],
-    'AUTH0_CALLBACK_URL': os.environ['CALLBACK_URL']
+    'AUTH0_CALLBACK_URL': os.environ['CALLBACK_URL'],
+    'JWKS_URL': os.environ.get(
+        'JWKS_URL',
+        'https://{}/.well-known/jwks.json'.format(
+            os.environ['AUTH0_DOMAIN_NAME'])),
+    'JWKS_TTL': int(os.environ.get('JWKS_TTL', 600)),
+    'JWKS_MIN_REFRESH_INTERVAL': int(
+        os.environ.get('JWKS_MIN_REFRESH_INTERVAL', 30)),
+    'JWKS_REFRESH_MARGIN': int(os.environ.get('JWKS_REFRESH_MARGIN', 60)),
+    'JWKS_PRELOAD': os.environ.get('JWKS_PRELOAD', 'true') == 'true',
+    'TOKEN_CACHE_SIZE': int(os.environ.get('TOKEN_CACHE_SIZE', 1024))
+}
+
+api_config = {
+    'MAX_PAGE_SIZE': int(os.environ.get('MAX_PAGE_SIZE', 100)),
+    'STREAM_BATCH_SIZE': int(os.environ.get('STREAM_BATCH_SIZE', 500)),
+    'MAX_BATCH_SIZE': int(os.environ.get('MAX_BATCH_SIZE', 1000)),
+    'RESPONSE_CACHE_BYTES': int(
+        os.environ.get('RESPONSE_CACHE_BYTES', 16 * 1024 * 1024)),
+    'CATALOG_VERSION_TTL': float(os.environ.get('CATALOG_VERSION_TTL', 1)),
+    'METRICS_ENABLED': os.environ.get('METRICS_ENABLED', 'false') == 'true',
+    'QUERY_BUDGET': os.environ.get('QUERY_BUDGET', 'off'),
+    'QUERY_REPEAT_THRESHOLD': int(
+        os.environ.get('QUERY_REPEAT_THRESHOLD', 5)),
+    'JSON_ENCODER': os.environ.get('JSON_ENCODER', 'auto'),
+    'COMPRESSION': os.environ.get('COMPRESSION', 'true') == 'true',
+    'COMPRESSION_MIN_BYTES': int(
+        os.environ.get('COMPRESSION_MIN_BYTES', 1024)),
+    'GZIP_LEVEL': int(os.environ.get('GZIP_LEVEL', 6)),
+    'BROTLI_QUALITY': int(os.environ.get('BROTLI_QUALITY', 4)),
+    'IDEMPOTENCY_TTL': int(os.environ.get('IDEMPOTENCY_TTL', 24 * 60 * 60)),
+    # Longer than a request can run: gunicorn kills workers after
+    # GUNICORN_TIMEOUT seconds.
+    'IDEMPOTENCY_LEASE': int(os.environ.get(
+        'IDEMPOTENCY_LEASE', 3 * int(os.environ.get('GUNICORN_TIMEOUT', 30)))),
+    'IDEMPOTENCY_PURGE_BATCH': int(
+        os.environ.get('IDEMPOTENCY_PURGE_BATCH', 500)),
+    'IDEMPOTENCY_PURGE_EVERY': int(
+        os.environ.get('IDEMPOTENCY_PURGE_EVERY', 100))
 }
@@ -0,0 +1,57 @@
+import json
+import datetime
+from flask.json import JSONEncoder
+from config import api_config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def encode_date(value):
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    raise TypeError('Object of type {} is not JSON serializable'.format(
+        type(value).__name__))
+
+
+class ISODateJSONEncoder(JSONEncoder):
+    '''Flask's encoder with dates written as ISO-8601 instead of HTTP
+    dates, so jsonify agrees with dumps below.'''
+
+    def default(self, o):
+        if isinstance(o, datetime.date):
+            return o.isoformat()
+        return super().default(o)
+
+
+def stdlib_dumps(obj):
+    return json.dumps(obj, default=encode_date, separators=(',', ':'),
+                      ensure_ascii=False).encode('utf-8')
+
+
+def orjson_dumps(obj):
+    # orjson writes date and datetime as ISO-8601 itself.
+    return orjson.dumps(obj)
+
+
+ENCODERS = {'stdlib': stdlib_dumps}
+if orjson is not None:
+    ENCODERS['orjson'] = orjson_dumps
+
+
+def get_dumps(name='auto'):
+    '''Returns a function serializing an object straight to JSON bytes.
+
+    'auto' picks orjson when it is installed and the standard library
+    otherwise.
+    '''
+    if name == 'auto':
+        name = 'orjson' if orjson is not None else 'stdlib'
+    if name not in ENCODERS:
+        raise ValueError('Unknown or unavailable JSON encoder: ' + name)
+    return ENCODERS[name]
+
+
+dumps = get_dumps(api_config['JSON_ENCODER'])
@@ -0,0 +1,72 @@
+import os
+import multiprocessing
+
+# Production profile for gunicorn, used by the Procfile:
+#
+#   gunicorn --config gunicorn_prod.py api:app
+#
+# The app is imported once in the master (the first JWKS fetch runs
+# once, not once per worker) and forked into the workers,
+# which open their pooled database connections before taking requests.
+
+
+def cpu_count():
+    # The CPUs this process may run on, which in a container can be fewer
+    # than the machine has.
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return multiprocessing.cpu_count()
+
+
+CPUS = cpu_count()
+
+# gthread (default), gevent or sync.
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+# Heroku sets WEB_CONCURRENCY from the dyno size.
+workers = int(os.environ.get('WEB_CONCURRENCY', CPUS * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 100))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+preload_app = True
+
+if worker_class == 'gevent':
+    # Patched before the app is preloaded, so the JWKS refresher and the
+    # database driver run on greenlets in every worker.
+    from gevent import monkey
+    monkey.patch_all()
+    try:
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+    except ImportError:
+        pass
+    concurrency = worker_connections
+else:
+    concurrency = threads if worker_class == 'gthread' else 1
+
+# One pooled connection per request a worker can serve at once, unless
+# set explicitly. Read by config.py when the app is preloaded below.
+os.environ.setdefault('DB_POOL_SIZE', str(min(concurrency, 20)))
+
+
+def when_ready(server):
+    # Connections opened by create_app in the master must not be shared
+    # with the forked workers; each worker opens its own.
+    if server.cfg.preload_app:
+        from models import db
+        db.engine.dispose()
+
+
+def post_worker_init(worker):
+    from models import warm_pool
+    from auth import warm_jwks
+    try:
+        opened = warm_pool(concurrency)
+        # The key set fetched by the master is inherited; this only fetches
+        # if that failed, and makes sure the refresher runs in the worker.
+        warm_jwks()
+    except Exception as error:
+        # The worker still serves requests, connecting on demand.
+        worker.log.warning('Warm-up failed: %s', error)
+    else:
+        worker.log.info('Warmed %d database connections', opened)
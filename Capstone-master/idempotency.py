@@ -0,0 +1,218 @@
+import hashlib
+import datetime
+import functools
+import itertools
+from flask import Response, request, current_app, abort
+from werkzeug.exceptions import HTTPException
+from models import db, IdempotencyKey
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from config import api_config
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+_requests = itertools.count(1)
+
+
+def fingerprint(payload):
+    # Who sent the request and what it asked for; a key reused for a
+    # different request is refused rather than answered with the wrong
+    # response.
+    digest = hashlib.sha256()
+    for part in (payload.get('sub', ''), request.method, request.path):
+        digest.update(part.encode('utf-8') + b'\0')
+    digest.update(request.get_data())
+    return digest.hexdigest()
+
+
+def lease_until(now):
+    return now + datetime.timedelta(seconds=api_config['IDEMPOTENCY_LEASE'])
+
+
+def stale(table, now):
+    # Rows a new request may take over: expired ones, and in-progress ones
+    # whose request has outlived its lease, e.g. because its worker died.
+    return (table.c.expires_at < now) | (
+        table.c.status_code.is_(None) & (table.c.locked_until < now))
+
+
+def claim(key, digest, now):
+    '''Inserts an in-progress row for `key` unless a live one exists, and
+    commits it. Returns the row's lease, its locked_until, when this
+    request owns the key, otherwise None.
+
+    The primary key decides between concurrent duplicates: the database
+    lets one insert through and turns the others into no-ops, without
+    locking anything but that key. On Postgres a stale row is taken over
+    by the same statement.
+    '''
+    table = IdempotencyKey.__table__
+    lease = lease_until(now)
+    row = {"key": key, "fingerprint": digest, "locked_until": lease,
+           "expires_at": now + datetime.timedelta(
+               seconds=api_config['IDEMPOTENCY_TTL'])}
+    if db.engine.dialect.name == 'postgresql':
+        statement = pg_insert(table).values(row)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.key],
+            set_={"fingerprint": statement.excluded.fingerprint,
+                  "status_code": None, "mimetype": None, "body": None,
+                  "locked_until": statement.excluded.locked_until,
+                  "expires_at": statement.excluded.expires_at},
+            where=stale(table, now))
+    else:
+        statement = table.insert().values(row).prefix_with('OR IGNORE')
+    claimed = db.session.execute(statement).rowcount == 1
+    db.session.commit()
+    return lease if claimed else None
+
+
+def find(key):
+    table = IdempotencyKey.__table__
+    return db.session.execute(
+        table.select().where(table.c.key == key)).first()
+
+
+def owned(table, key, lease):
+    # A request whose lease ran out and whose key was taken over by a
+    # retry no longer matches, and leaves the retry's row alone.
+    return (table.c.key == key) & (table.c.locked_until == lease)
+
+
+def release(key, lease):
+    table = IdempotencyKey.__table__
+    db.session.rollback()
+    db.session.execute(table.delete().where(owned(table, key, lease)))
+    db.session.commit()
+
+
+def discard_stale(key, now):
+    # Only if still stale: another request may have just claimed it.
+    table = IdempotencyKey.__table__
+    db.session.execute(table.delete().where(
+        (table.c.key == key) & stale(table, now)))
+    db.session.commit()
+
+
+def acquire(key, digest, now):
+    # (lease, None) when this request now owns the key, otherwise
+    # (None, row) with the live row stored for it. A row that went stale,
+    # or was purged, between the attempts is claimed afresh.
+    for attempt in range(3):
+        lease = claim(key, digest, now)
+        if lease is not None:
+            return lease, None
+        row = find(key)
+        if row is None:
+            continue
+        if row.expires_at >= now and (
+                row.status_code is not None or row.locked_until >= now):
+            return None, row
+        discard_stale(key, now)
+    abort(409)
+
+
+def store(key, lease, response):
+    table = IdempotencyKey.__table__
+    db.session.execute(table.update().where(owned(table, key, lease)).values(
+        status_code=response.status_code, mimetype=response.mimetype,
+        body=response.get_data()))
+    db.session.commit()
+
+
+def replay(row):
+    response = Response(row.body, status=row.status_code,
+                        mimetype=row.mimetype)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def purge_expired(batch_size=None, max_batches=None):
+    '''Deletes expired keys `batch_size` at a time, each batch in its own
+    short transaction, and returns how many were deleted.'''
+    batch_size = batch_size or api_config['IDEMPOTENCY_PURGE_BATCH']
+    table = IdempotencyKey.__table__
+    deleted = 0
+    for batch in itertools.count():
+        if max_batches is not None and batch >= max_batches:
+            break
+        expired = db.session.query(IdempotencyKey.key).filter(
+            IdempotencyKey.expires_at < datetime.datetime.utcnow()).order_by(
+            IdempotencyKey.expires_at).limit(batch_size)
+        if db.engine.dialect.name == 'postgresql':
+            # Workers purging at the same time take different rows.
+            expired = expired.with_for_update(skip_locked=True)
+        keys = [key for (key,) in expired]
+        if keys:
+            db.session.execute(table.delete().where(table.c.key.in_(keys)))
+        db.session.commit()
+        deleted += len(keys)
+        if len(keys) < batch_size:
+            break
+    return deleted
+
+
+def purge_later(response):
+    # Every IDEMPOTENCY_PURGE_EVERY keyed requests one batch of expired
+    # keys is purged, once the response has been sent.
+    every = api_config['IDEMPOTENCY_PURGE_EVERY']
+    if every and next(_requests) % every == 0:
+        app = current_app._get_current_object()
+
+        def purge():
+            with app.app_context():
+                purge_expired(max_batches=1)
+        response.call_on_close(purge)
+    return response
+
+
+def run_view(view, args, kwargs):
+    # The view's response, with aborts rendered by the app's error
+    # handlers so they can be stored too.
+    try:
+        rv = view(*args, **kwargs)
+    except HTTPException as error:
+        rv = current_app.handle_user_exception(error)
+    return current_app.make_response(rv)
+
+
+def idempotent(f):
+    '''Lets a client retry a POST with the same Idempotency-Key header.
+
+    The first request with a key runs and its response is stored for
+    IDEMPOTENCY_TTL seconds; retries get that response back, marked with
+    an Idempotent-Replayed header, without running the view again. A
+    retry arriving while the first request is still running gets a 409,
+    for up to IDEMPOTENCY_LEASE seconds; after that the first request is
+    presumed dead and the retry runs the view.
+    Responses with a 5xx status, and views that raise, are not stored, so
+    the next retry runs the view again. Requests without the header are
+    not affected.
+    '''
+    @functools.wraps(f)
+    def wrapper(payload, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return f(payload, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            abort(422)
+        digest = fingerprint(payload)
+        now = datetime.datetime.utcnow()
+        lease, row = acquire(key, digest, now)
+        if row is not None:
+            if row.fingerprint != digest:
+                abort(422)
+            if row.status_code is None:
+                abort(409)
+            return purge_later(replay(row))
+        try:
+            response = run_view(f, (payload,) + args, kwargs)
+        except Exception:
+            release(key, lease)
+            raise
+        if response.status_code >= 500:
+            release(key, lease)
+        else:
+            store(key, lease, response)
+        return purge_later(response)
+    return wrapper
@@ -0,0 +1,12 @@
+import os
+import atexit
+from bench_data import use_database
+
+# Imported before api or models by the tests that run against a throwaway
+# sqlite file (test_asgi.py, test_idempotency.py and test_replica.py),
+# whether run on their own or together in one pytest session: the first
+# import picks the database for the whole process, and the file is
+# removed when the process exits.
+os.environ['JWKS_PRELOAD'] = 'false'
+path = use_database()
+atexit.register(os.remove, path)
@@ -1,8 +1,18 @@
+import os
 from flask_script import Manager
-from flask_migrate import Migrate, MigrateCommand
+from flask_migrate import Migrate, MigrateCommand, stamp, upgrade
+from sqlalchemy import inspect
 
-from api import app
-from models import db
+# The schema comes from migrations/versions, not from db.create_all().
+os.environ.setdefault('DB_CREATE_ALL', 'false')
+
+from api import app  # noqa: E402
+from models import db  # noqa: E402
+from idempotency import purge_expired  # noqa: E402
+
+# The revision matching the tables db.create_all() made before the
+# migrations existed.
+BASELINE = '3f1c2a9d7b10'
 
 migrate = Migrate(app, db)
 manager = Manager(app)
@@ -10,5 +20,20 @@ manager = Manager(app)
 manager.add_command('db', MigrateCommand)
 
 
+@manager.command
+def upgrade_db():
+    "Upgrades the database, first stamping one made before the migrations."
+    tables = inspect(db.engine).get_table_names()
+    if 'alembic_version' not in tables and 'actors' in tables:
+        stamp(revision=BASELINE)
+    upgrade()
+
+
+@manager.command
+def purge_idempotency_keys():
+    "Deletes expired Idempotency-Key responses in batches."
+    print('Deleted', purge_expired(), 'expired idempotency keys')
+
+
 if __name__ == '__main__':
     manager.run()
@@ -0,0 +1,290 @@
+import time
+import threading
+from flask import g, request, Response, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from config import api_config
+
+
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+           0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+PHASES = ('auth', 'db', 'serialize', 'other')
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    pairs = []
+    for name, value in zip(names, values):
+        value = str(value).replace('\\', '\\\\').replace(
+            '"', '\\"').replace('\n', '\\n')
+        pairs.append('{}="{}"'.format(name, value))
+    return '{' + ','.join(pairs) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+    '''Cumulative-bucket histogram per label set, in Prometheus layout.'''
+
+    def __init__(self, name, help, labels, buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, values, amount):
+        with self._lock:
+            series = self._series.get(values)
+            if series is None:
+                series = self._series[values] = [
+                    [0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if amount <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += amount
+            series[2] += 1
+
+    def render(self):
+        lines = ['# HELP {} {}'.format(self.name, self.help),
+                 '# TYPE {} histogram'.format(self.name)]
+        with self._lock:
+            series = sorted(
+                (values, list(counts), total, count)
+                for values, (counts, total, count) in self._series.items())
+        for values, counts, total, count in series:
+            cumulative = 0
+            for bound, bucket in zip(self.buckets, counts):
+                cumulative += bucket
+                lines.append('{}_bucket{} {}'.format(
+                    self.name,
+                    format_labels(self.labels + ('le',),
+                                  values + (format_value(bound),)),
+                    cumulative))
+            lines.append('{}_bucket{} {}'.format(
+                self.name,
+                format_labels(self.labels + ('le',), values + ('+Inf',)),
+                count))
+            labels = format_labels(self.labels, values)
+            lines.append('{}_sum{} {}'.format(
+                self.name, labels, format_value(total)))
+            lines.append('{}_count{} {}'.format(self.name, labels, count))
+        return lines
+
+
+def sample(name, help, value, kind='gauge'):
+    return ['# HELP {} {}'.format(name, help),
+            '# TYPE {} {}'.format(name, kind),
+            '{} {}'.format(name, format_value(value))]
+
+
+class _NoPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NO_PHASE = _NoPhase()
+
+
+class _Phase:
+    # Time spent in database queries while the phase is open is left to
+    # the db phase, so the phases of a request add up to its duration.
+    def __init__(self, state, name):
+        self.state = state
+        self.name = name
+
+    def __enter__(self):
+        self.db = self.state['phases']['db']
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        phases = self.state['phases']
+        elapsed = time.perf_counter() - self.start
+        phases[self.name] += elapsed - (phases['db'] - self.db)
+        return False
+
+
+class RequestMetrics:
+    '''Per-route request and phase timings, exported at /metrics.
+
+    When disabled no hooks or event listeners are installed and phase()
+    hands back a shared no-op context manager, so the cost is one
+    attribute check per instrumented block.
+    '''
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.duration = Histogram(
+            'casting_request_duration_seconds',
+            'Time to handle a request, including a streamed body.',
+            ('method', 'route', 'status'))
+        self.phases = Histogram(
+            'casting_request_phase_seconds',
+            'Time spent in each phase of a request.',
+            ('method', 'route', 'phase'))
+        self.queries = Histogram(
+            'casting_request_queries',
+            'Database queries executed by a request.',
+            ('method', 'route'), buckets=QUERY_BUCKETS)
+        self._listening = False
+
+    def phase(self, name):
+        if not self.enabled or not has_request_context():
+            return NO_PHASE
+        state = g.get('metrics')
+        if state is None:
+            return NO_PHASE
+        return _Phase(state, name)
+
+    def init_app(self, app):
+        if not self.enabled:
+            return
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute',
+                         self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute',
+                         self._after_cursor_execute)
+            self._listening = True
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.add_url_rule('/metrics', 'metrics', self.render_response)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters,
+                               context, executemany):
+        if has_request_context():
+            context._metrics_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters,
+                              context, executemany):
+        start = getattr(context, '_metrics_start', None)
+        if start is None:
+            return
+        state = g.get('metrics')
+        if state is not None:
+            state['phases']['db'] += time.perf_counter() - start
+            state['queries'] += 1
+
+    def _start_request(self):
+        g.metrics = {'start': time.perf_counter(), 'queries': 0,
+                     'phases': dict.fromkeys(PHASES, 0.0)}
+
+    def _finish_request(self, response):
+        state = g.get('metrics')
+        if state is None or request.endpoint == 'metrics':
+            return response
+        rule = request.url_rule.rule if request.url_rule else 'unmatched'
+        values = (request.method, rule)
+        status = str(response.status_code)
+        # A streamed body is still being generated after this hook, so
+        # the request is recorded once the server closes the response.
+        response.call_on_close(
+            lambda: self._record(state, values, status))
+        return response
+
+    def _record(self, state, values, status):
+        elapsed = time.perf_counter() - state['start']
+        phases = state['phases']
+        phases['other'] = max(
+            elapsed - phases['auth'] - phases['db'] - phases['serialize'],
+            0.0)
+        self.duration.observe(values + (status,), elapsed)
+        for name in PHASES:
+            self.phases.observe(values + (name,), phases[name])
+        self.queries.observe(values, state['queries'])
+
+    def render(self):
+        # Imported here so metrics.py stays importable from auth.py.
+        from auth import jwks_store, token_cache
+        from cache import response_cache
+        from models import db, pool_wait
+        from replica import replica_router
+
+        lines = self.duration.render() + self.phases.render() + \
+            self.queries.render()
+        pool = db.engine.pool
+        if isinstance(pool, QueuePool):
+            lines += sample('casting_db_pool_size',
+                            'Connections the pool keeps open.', pool.size())
+            lines += sample('casting_db_pool_checked_out',
+                            'Connections currently in use.',
+                            pool.checkedout())
+            lines += sample('casting_db_pool_overflow',
+                            'Connections open beyond the pool size.',
+                            pool.overflow())
+        wait = pool_wait.stats()
+        lines += sample('casting_db_pool_checkouts_total',
+                        'Connections checked out of the pool.',
+                        wait['checkouts'], 'counter')
+        lines += sample('casting_db_pool_wait_seconds_total',
+                        'Time spent waiting for a pooled connection.',
+                        wait['total_seconds'], 'counter')
+        lines += sample('casting_db_pool_wait_seconds_max',
+                        'Longest wait for a pooled connection.',
+                        wait['max_seconds'])
+        cache = response_cache.stats()
+        lines += sample('casting_response_cache_hits_total',
+                        'List responses served from the cache.',
+                        cache['hits'], 'counter')
+        lines += sample('casting_response_cache_misses_total',
+                        'List responses built because of a cache miss.',
+                        cache['misses'], 'counter')
+        lines += sample('casting_response_cache_evictions_total',
+                        'Entries evicted from the response cache.',
+                        cache['evictions'], 'counter')
+        lines += sample('casting_response_cache_bytes',
+                        'Bytes of cached response bodies.', cache['bytes'])
+        lines += sample('casting_token_cache_hits_total',
+                        'Tokens found in the verified-token cache.',
+                        token_cache.hits, 'counter')
+        lines += sample('casting_token_cache_misses_total',
+                        'Tokens verified because of a cache miss.',
+                        token_cache.misses, 'counter')
+        keys = jwks_store.stats()
+        lines += sample('casting_jwks_keys',
+                        'Signing keys currently loaded.', keys['keys'])
+        if keys['age_seconds'] is not None:
+            lines += sample('casting_jwks_age_seconds',
+                            'Seconds since the key set was last fetched.',
+                            keys['age_seconds'])
+        lines += sample('casting_jwks_fetch_errors_total',
+                        'Failed key set fetches.',
+                        keys['fetch_errors'], 'counter')
+        lines += sample('casting_jwks_consecutive_errors',
+                        'Key set fetches failed since the last success.',
+                        keys['consecutive_errors'])
+        replica = replica_router.stats()
+        if replica['enabled']:
+            lines += sample('casting_replica_healthy',
+                            '1 while reads may go to the replica.',
+                            int(replica['healthy']))
+            lines += sample('casting_replica_reads_total',
+                            'Read requests sent to the replica.',
+                            replica['replica_reads'], 'counter')
+            lines += sample('casting_replica_primary_reads_total',
+                            'Read requests kept on the primary.',
+                            replica['primary_reads'], 'counter')
+            lines += sample('casting_replica_lag_fallbacks_total',
+                            'Reads sent to the primary because the replica '
+                            'lagged or was unreachable.',
+                            replica['lag_fallbacks'], 'counter')
+        return '\n'.join(lines) + '\n'
+
+    def render_response(self):
+        return Response(self.render(),
+                        mimetype='text/plain; version=0.0.4')
+
+
+request_metrics = RequestMetrics(api_config['METRICS_ENABLED'])
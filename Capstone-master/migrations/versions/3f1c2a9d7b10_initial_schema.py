@@ -0,0 +1,53 @@
+"""initial schema
+
+Revision ID: 3f1c2a9d7b10
+Revises:
+Create Date: 2026-10-18 09:12:41.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '3f1c2a9d7b10'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'actors',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.Column('age', sa.Integer(), nullable=True),
+        sa.Column('gender', postgresql.ENUM(
+            'female', 'male', 'not_applicable', name='gender'),
+            nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table(
+        'movies',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(), nullable=True),
+        sa.Column('release_date', sa.Date(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table(
+        'relation',
+        sa.Column('movie_id', sa.Integer(), nullable=False),
+        sa.Column('actor_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['actor_id'], ['actors.id'],
+                                name='relation_actor_id_fkey'),
+        sa.ForeignKeyConstraint(['movie_id'], ['movies.id'],
+                                name='relation_movie_id_fkey'),
+        sa.PrimaryKeyConstraint('movie_id', 'actor_id')
+    )
+
+
+def downgrade():
+    op.drop_table('relation')
+    op.drop_table('movies')
+    op.drop_table('actors')
+    postgresql.ENUM(name='gender').drop(op.get_bind())
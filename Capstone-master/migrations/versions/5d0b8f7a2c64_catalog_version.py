@@ -0,0 +1,34 @@
+"""catalog version shared by the workers' response caches
+
+Revision ID: 5d0b8f7a2c64
+Revises: 3f1c2a9d7b10
+Create Date: 2026-10-18 09:26:53.870412
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d0b8f7a2c64'
+down_revision = '3f1c2a9d7b10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # db.create_all() of a later version may already have added the table
+    # to a database stamped at the initial revision.
+    if 'catalog_version' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    catalog_version = op.create_table(
+        'catalog_version',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(catalog_version, [{'id': 1, 'version': 0}])
+
+
+def downgrade():
+    op.drop_table('catalog_version')
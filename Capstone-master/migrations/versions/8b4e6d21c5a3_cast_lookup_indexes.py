@@ -0,0 +1,48 @@
+"""index the reverse cast lookup and cascade cast deletes
+
+Revision ID: 8b4e6d21c5a3
+Revises: 5d0b8f7a2c64
+Create Date: 2026-10-18 09:40:07.552190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b4e6d21c5a3'
+down_revision = '5d0b8f7a2c64'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_relation_actor_id_movie_id', 'relation',
+                    ['actor_id', 'movie_id'], unique=False)
+    op.create_index('ix_actors_name', 'actors', ['name'], unique=False)
+    op.create_index('ix_movies_title', 'movies', ['title'], unique=False)
+    op.create_index('ix_movies_release_date', 'movies', ['release_date'],
+                    unique=False)
+    op.drop_constraint('relation_actor_id_fkey', 'relation',
+                       type_='foreignkey')
+    op.drop_constraint('relation_movie_id_fkey', 'relation',
+                       type_='foreignkey')
+    op.create_foreign_key('relation_actor_id_fkey', 'relation', 'actors',
+                          ['actor_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('relation_movie_id_fkey', 'relation', 'movies',
+                          ['movie_id'], ['id'], ondelete='CASCADE')
+
+
+def downgrade():
+    op.drop_constraint('relation_movie_id_fkey', 'relation',
+                       type_='foreignkey')
+    op.drop_constraint('relation_actor_id_fkey', 'relation',
+                       type_='foreignkey')
+    op.create_foreign_key('relation_movie_id_fkey', 'relation', 'movies',
+                          ['movie_id'], ['id'])
+    op.create_foreign_key('relation_actor_id_fkey', 'relation', 'actors',
+                          ['actor_id'], ['id'])
+    op.drop_index('ix_movies_release_date', table_name='movies')
+    op.drop_index('ix_movies_title', table_name='movies')
+    op.drop_index('ix_actors_name', table_name='actors')
+    op.drop_index('ix_relation_actor_id_movie_id', table_name='relation')
@@ -0,0 +1,24 @@
+"""index the gender filter
+
+Revision ID: a93c5e1f7d20
+Revises: e2a7b94c6d15
+Create Date: 2026-10-18 23:05:12.440917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a93c5e1f7d20'
+down_revision = 'e2a7b94c6d15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_actors_gender_id', 'actors', ['gender', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_actors_gender_id', table_name='actors')
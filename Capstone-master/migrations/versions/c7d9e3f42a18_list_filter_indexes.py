@@ -0,0 +1,45 @@
+"""indexes for list filters and sorting
+
+Revision ID: c7d9e3f42a18
+Revises: 8b4e6d21c5a3
+Create Date: 2026-10-18 11:05:52.904417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d9e3f42a18'
+down_revision = '8b4e6d21c5a3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # The (column, id) indexes serve everything the single column ones did,
+    # plus keyset pagination in that order.
+    op.drop_index('ix_actors_name', table_name='actors')
+    op.drop_index('ix_movies_title', table_name='movies')
+    op.drop_index('ix_movies_release_date', table_name='movies')
+    op.create_index('ix_actors_name_prefix', 'actors',
+                    [sa.text('lower(name) varchar_pattern_ops')])
+    op.create_index('ix_actors_name_id', 'actors', ['name', 'id'])
+    op.create_index('ix_actors_age_id', 'actors', ['age', 'id'])
+    op.create_index('ix_movies_title_prefix', 'movies',
+                    [sa.text('lower(title) varchar_pattern_ops')])
+    op.create_index('ix_movies_title_id', 'movies', ['title', 'id'])
+    op.create_index('ix_movies_release_date_id', 'movies',
+                    ['release_date', 'id'])
+
+
+def downgrade():
+    op.drop_index('ix_movies_release_date_id', table_name='movies')
+    op.drop_index('ix_movies_title_id', table_name='movies')
+    op.drop_index('ix_movies_title_prefix', table_name='movies')
+    op.drop_index('ix_actors_age_id', table_name='actors')
+    op.drop_index('ix_actors_name_id', table_name='actors')
+    op.drop_index('ix_actors_name_prefix', table_name='actors')
+    op.create_index('ix_movies_release_date', 'movies', ['release_date'])
+    op.create_index('ix_movies_title', 'movies', ['title'])
+    op.create_index('ix_actors_name', 'actors', ['name'])
@@ -0,0 +1,42 @@
+"""stored responses for Idempotency-Key retries
+
+Revision ID: e2a7b94c6d15
+Revises: c7d9e3f42a18
+Create Date: 2026-10-18 20:14:31.118604
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a7b94c6d15'
+down_revision = 'c7d9e3f42a18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # As with catalog_version, db.create_all() may have created the table,
+    # and its index, already.
+    if 'idempotency_keys' in sa.inspect(op.get_bind()).get_table_names():
+        return
+    op.create_table('idempotency_keys',
+                    sa.Column('key', sa.String(length=255), nullable=False),
+                    sa.Column('fingerprint', sa.String(length=64),
+                              nullable=False),
+                    sa.Column('status_code', sa.Integer(), nullable=True),
+                    sa.Column('mimetype', sa.String(length=100),
+                              nullable=True),
+                    sa.Column('body', sa.LargeBinary(), nullable=True),
+                    sa.Column('locked_until', sa.DateTime(), nullable=True),
+                    sa.Column('expires_at', sa.DateTime(), nullable=False),
+                    sa.PrimaryKeyConstraint('key'))
+    op.create_index('ix_idempotency_keys_expires_at', 'idempotency_keys',
+                    ['expires_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_idempotency_keys_expires_at',
+                  table_name='idempotency_keys')
+    op.drop_table('idempotency_keys')
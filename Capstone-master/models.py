@@ -1,34 +1,268 @@
 import os
+import time
+import threading
 from sqlalchemy import Column, String, Integer, create_engine, ForeignKey
-from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy.orm import relationship
-from sqlalchemy.dialects.postgresql import ENUM
-from config import database
+from sqlalchemy import Index, func, event, bindparam
+from sqlalchemy.pool import QueuePool
+from flask import g, has_app_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy.orm import relationship, sessionmaker
+from sqlalchemy.dialects.postgresql import ENUM, insert as pg_insert
+from config import database, db_config
 import json
 
 # Uncomment this while connecting to heroku
 database_path = os.environ['DATABASE_URL']
+# Optional read replica of database_path; see replica.py.
+replica_path = os.environ.get('DATABASE_REPLICA_URL')
 
 # Uncomment this while connecting locally
 """ database_path = "postgresql://{}:{}@{}/{}".format(
             database["username"], database["username_password"],
             database["port"], database["database_name"])
  """
-db = SQLAlchemy()
 
 
-def setup_db(app, database_path=database_path):
+class RoutingSession(SignallingSession):
+    # Sends a request's queries to the bind replica.py chose for it.
+    def __init__(self, db, **options):
+        self.db = db
+        super().__init__(db, **options)
+
+    def get_bind(self, mapper=None, clause=None):
+        bind = g.get('db_bind') if has_app_context() else None
+        if bind is not None:
+            return self.db.get_engine(self.app, bind=bind)
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def create_session(self, options):
+        return sessionmaker(class_=RoutingSession, db=self, **options)
+
+
+db = RoutingSQLAlchemy()
+
+
+class PoolWaitStats:
+    '''Time spent waiting for a connection to be checked out of the pool.'''
+
+    def __init__(self):
+        self.checkouts = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.checkouts += 1
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+
+    def stats(self):
+        return {"checkouts": self.checkouts,
+                "total_seconds": self.total_seconds,
+                "max_seconds": self.max_seconds}
+
+
+pool_wait = PoolWaitStats()
+
+
+class TimedQueuePool(QueuePool):
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_wait.record(time.perf_counter() - start)
+
+
+def engine_options(database_path):
+    # sqlite files are not pooled by a QueuePool, so only the server
+    # databases get the tunable pool.
+    if database_path.startswith('sqlite'):
+        return {}
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": db_config['POOL_SIZE'],
+        "max_overflow": db_config['MAX_OVERFLOW'],
+        "pool_pre_ping": db_config['POOL_PRE_PING'],
+        "pool_recycle": db_config['POOL_RECYCLE'],
+        "pool_timeout": db_config['POOL_TIMEOUT']
+    }
+
+
+def warm_pool(size):
+    '''Opens up to `size` pooled connections now and returns them to the
+    pool, so the first requests do not pay for connecting. Returns the
+    number opened; sqlite, which is not pooled, opens none.'''
+    engine = db.engine
+    if not isinstance(engine.pool, QueuePool):
+        return 0
+    size = min(size, db_config['POOL_SIZE'])
+    connections = [engine.connect() for _ in range(size)]
+    for connection in connections:
+        connection.close()
+    return size
+
+
+def enable_foreign_keys(connection, record):
+    connection.execute('PRAGMA foreign_keys=ON')
+
+
+def setup_db(app, database_path=database_path, replica_path=replica_path):
+    # Sessions are request scoped: the helpers below commit but never close
+    # the session, which Flask-SQLAlchemy removes (rolling back anything
+    # left uncommitted) when the request's app context is torn down.
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(database_path)
+    # No model is bound to the replica: only requests routed there use it,
+    # and create_all leaves its schema to replication.
+    app.config["SQLALCHEMY_BINDS"] = {"replica": replica_path} \
+        if replica_path else {}
     db.app = app
     db.init_app(app)
-    db.create_all()
+    if database_path.startswith('sqlite'):
+        # sqlite only enforces foreign keys, and so the cascading deletes
+        # of relation rows, when asked to on each connection.
+        event.listen(db.get_engine(app), 'connect', enable_foreign_keys)
+    # Only for scratch databases (DB_CREATE_ALL=true): everything else gets
+    # the schema from migrations/versions.
+    if db_config['CREATE_ALL']:
+        db.create_all()
+        if CatalogVersion.query.get(1) is None:
+            db.session.add(CatalogVersion(id=1, version=0))
+            db.session.commit()
+        db.session.close()
+
+
+class CatalogVersion(db.Model):
+    # Single row bumped in the same transaction as every write, so all
+    # workers agree on when the actor and movie lists last changed.
+    __tablename__ = 'catalog_version'
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+def bump_catalog_version():
+    # The last statement of every write, run once the write's own rows are
+    # locked: every transaction then takes the version row's lock after
+    # its other locks, so two writes cannot wait on each other through it,
+    # and the lock every write contends for is held only until the commit.
+    db.session.execute(CatalogVersion.__table__.update().values(
+        version=CatalogVersion.version + 1))
+
+
+def get_catalog_version():
+    return db.session.query(CatalogVersion.version).filter(
+        CatalogVersion.id == 1).scalar()
+
+
+def insert_many(model, rows):
+    # One multi-row INSERT ... RETURNING * where the dialect supports it,
+    # otherwise a single flush of all the new objects. Returns the inserted
+    # rows as dicts, ids included, in id order: Postgres does not promise
+    # RETURNING rows in the order of `rows`, so ids are never matched up
+    # with the input by position.
+    table = model.__table__
+    if db.engine.dialect.implicit_returning:
+        result = db.session.execute(
+            table.insert().values(rows).returning(*table.c))
+        inserted = [dict(row) for row in result]
+    else:
+        objects = [model(**row) for row in rows]
+        db.session.add_all(objects)
+        db.session.flush()
+        inserted = [{column.name: getattr(obj, column.name)
+                     for column in table.c} for obj in objects]
+    return sorted(inserted, key=lambda row: row['id'])
+
+
+def delete_many(model, ids):
+    # Deletes the rows with the given ids in one DELETE ... RETURNING id
+    # where the dialect supports it, otherwise a lookup and a DELETE, and
+    # returns the ids actually deleted. Their relation rows are deleted
+    # first, in the same transaction: databases created before the
+    # migrations have no ON DELETE CASCADE on them.
+    table = model.__table__
+    column = Relation.actor_id if model is Actors else Relation.movie_id
+    db.session.execute(Relation.__table__.delete().where(column.in_(ids)))
+    statement = table.delete().where(table.c.id.in_(ids))
+    if db.engine.dialect.implicit_returning:
+        return [row[0] for row in db.session.execute(
+            statement.returning(table.c.id))]
+    found = [id for (id,) in db.session.query(model.id).filter(
+        model.id.in_(ids))]
+    if found:
+        db.session.execute(statement)
+    return found
+
+
+def update_row(model, id, values):
+    # One UPDATE ... WHERE id = :id RETURNING * where the dialect supports
+    # it, otherwise an UPDATE and a SELECT of the row. Returns the updated
+    # row, or None when no row has that id.
+    table = model.__table__
+    statement = table.update().where(table.c.id == id).values(values)
+    if db.engine.dialect.implicit_returning:
+        return db.session.execute(statement.returning(*table.c)).first()
+    if db.session.execute(statement).rowcount == 0:
+        return None
+    return db.session.execute(
+        table.select().where(table.c.id == id)).first()
+
+
+def update_many(model, updates):
+    # Applies (id, values) updates with one executemany UPDATE per set of
+    # columns changed, then reads the rows back in one SELECT. Later
+    # updates to the same id win. Returns the updated rows.
+    table = model.__table__
+    merged = {}
+    for id, values in updates:
+        merged.setdefault(id, {}).update(values)
+    shapes = {}
+    for id, values in merged.items():
+        shapes.setdefault(tuple(sorted(values)), []).append(
+            dict(values, _id=id))
+    for columns, params in shapes.items():
+        db.session.execute(table.update().where(
+            table.c.id == bindparam('_id')).values(
+            {column: bindparam(column) for column in columns}), params)
+    return db.session.execute(table.select().where(
+        table.c.id.in_(list(merged))).order_by(table.c.id)).fetchall()
+
+
+def insert_relations(pairs):
+    # Inserts (movie_id, actor_id) pairs in one statement, skipping pairs
+    # that already exist, and returns the set of pairs actually created.
+    table = Relation.__table__
+    rows = [{"movie_id": movie_id, "actor_id": actor_id}
+            for movie_id, actor_id in pairs]
+    if not rows:
+        return set()
+    if db.engine.dialect.name == 'postgresql':
+        result = db.session.execute(
+            pg_insert(table).values(rows).on_conflict_do_nothing().returning(
+                table.c.movie_id, table.c.actor_id))
+        return {tuple(row) for row in result}
+    existing = {tuple(row) for row in db.session.query(
+        Relation.movie_id, Relation.actor_id).filter(
+        Relation.movie_id.in_({movie_id for movie_id, _ in pairs}),
+        Relation.actor_id.in_({actor_id for _, actor_id in pairs}))}
+    db.session.execute(table.insert().prefix_with('OR IGNORE'), rows)
+    return set(pairs) - existing
 
 
 class Relation(db.Model):
     __tablename__ = 'relation'
-    movie_id = Column(Integer, ForeignKey('movies.id'), primary_key=True)
-    actor_id = Column(Integer, ForeignKey('actors.id'), primary_key=True)
+    movie_id = Column(Integer, ForeignKey('movies.id', ondelete='CASCADE'),
+                      primary_key=True)
+    actor_id = Column(Integer, ForeignKey('actors.id', ondelete='CASCADE'),
+                      primary_key=True)
+    # The primary key leads with movie_id; this serves lookups by actor.
+    __table_args__ = (
+        Index('ix_relation_actor_id_movie_id', 'actor_id', 'movie_id'),)
 
     def __init__(self, movie_id, actor_id):
         self.movie_id = movie_id
@@ -37,20 +271,16 @@ class Relation(db.Model):
     def delete(self):
         db.session.delete(self)
         db.session.commit()
-        db.session.close()
 
     def insert(self):
         db.session.add(self)
         db.session.commit()
-        db.session.close()
 
     def commit():
         db.session.commit()
-        db.session.close()
 
     def rollback():
         db.session.rollback()
-        db.session.close()
 
 
 class Movies(db.Model):
@@ -61,6 +291,13 @@ class Movies(db.Model):
     release_date = Column(db.Date)
     actors = relationship("Actors", secondary='relation',
                           back_populates="movies")
+    # Case-insensitive title prefix search, and keyset sorting by title or
+    # release date.
+    __table_args__ = (
+        Index('ix_movies_title_prefix', func.lower(title).label('lower_title'),
+              postgresql_ops={'lower_title': 'varchar_pattern_ops'}),
+        Index('ix_movies_title_id', 'title', 'id'),
+        Index('ix_movies_release_date_id', 'release_date', 'id'))
 
     def __init__(self, title, release_date=release_date):
         self.title = title
@@ -69,20 +306,16 @@ class Movies(db.Model):
     def insert(self):
         db.session.add(self)
         db.session.commit()
-        db.session.close()
 
     def rollback():
         db.session.rollback()
-        db.session.close()
 
     def commit():
         db.session.commit()
-        db.session.close()
 
     def delete(self):
         db.session.delete(self)
         db.session.commit()
-        db.session.close()
 
     def format(self, actors):
         d = {"id": self.id, "title": self.title,
@@ -99,6 +332,15 @@ class Actors(db.Model):
     movies = relationship("Movies", secondary='relation',
                           back_populates="actors")
     gender = Column(ENUM("female", "male", "not_applicable", name="gender"))
+    # Case-insensitive name prefix search, keyset sorting by name or age
+    # (the age index also serves age ranges), and the gender filter in id
+    # order.
+    __table_args__ = (
+        Index('ix_actors_name_prefix', func.lower(name).label('lower_name'),
+              postgresql_ops={'lower_name': 'varchar_pattern_ops'}),
+        Index('ix_actors_name_id', 'name', 'id'),
+        Index('ix_actors_age_id', 'age', 'id'),
+        Index('ix_actors_gender_id', 'gender', 'id'))
 
     def __init__(self, name, age, gender):
         self.name = name
@@ -108,22 +350,33 @@ class Actors(db.Model):
     def insert(self):
         db.session.add(self)
         db.session.commit()
-        db.session.close()
 
     def rollback():
         db.session.rollback()
-        db.session.close()
 
     def commit():
         db.session.commit()
-        db.session.close()
 
     def delete(self):
         db.session.delete(self)
         db.session.commit()
-        db.session.close()
 
     def format(self, movies):
         d = {"id": self.id, "name": self.name, "age": self.age,
              "gender": self.gender, "movies": movies}
         return d
+
+
+class IdempotencyKey(db.Model):
+    # The first response to each Idempotency-Key, replayed to retries of
+    # the same request until expires_at. status_code is null while the
+    # first request is still running, which it is presumed to be until
+    # locked_until.
+    __tablename__ = 'idempotency_keys'
+    key = Column(String(255), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    status_code = Column(Integer)
+    mimetype = Column(String(100))
+    body = Column(db.LargeBinary)
+    locked_until = Column(db.DateTime)
+    expires_at = Column(db.DateTime, nullable=False, index=True)
@@ -0,0 +1,123 @@
+import re
+from collections import Counter
+from flask import g, request, current_app, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from config import api_config
+
+
+# Most statements a request to each route may run before its response is
+# returned. Routes left out, or set to None, are not checked: the bulk
+# inserts run one INSERT per row on databases without RETURNING, and a
+# streamed body runs its queries after the response has been returned.
+# A sorted listing reads the rows without a value for the sort field with
+# a second query when the page is not filled. The POST budgets include
+# the two statements that claim and store an Idempotency-Key.
+BUDGETS = {
+    ('GET', '/'): 0,
+    ('GET', '/authorization'): 0,
+    ('GET', '/actors'): 4,
+    ('GET', '/movies'): 4,
+    ('POST', '/actors'): 4,
+    ('POST', '/movies'): 4,
+    ('POST', '/actors/bulk'): None,
+    ('POST', '/movies/bulk'): None,
+    ('POST', '/movies/cast'): 4,
+    ('POST', '/movies/cast/bulk'): 7,
+    ('DELETE', '/actors/<id>'): 4,
+    ('DELETE', '/movies/<id>'): 4,
+    ('DELETE', '/actors'): 4,
+    ('DELETE', '/movies'): 4,
+    ('DELETE', '/movies/cast'): 3,
+    ('PATCH', '/actors/<id>'): 3,
+    ('PATCH', '/movies/<id>'): 3,
+    # One UPDATE per distinct set of fields changed, at most 7 for actors
+    # and 3 for movies.
+    ('PATCH', '/actors'): 9,
+    ('PATCH', '/movies'): 5,
+}
+
+PLACEHOLDER = r'(?:\?|%s|%\(\w+\)s|:\w+)'
+PLACEHOLDER_LIST = re.compile(
+    r'\(\s*' + PLACEHOLDER + r'(?:\s*,\s*' + PLACEHOLDER + r')+\s*\)')
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def statement_shape(statement):
+    '''Collapses whitespace and IN lists, so the same query made for
+    different rows has the same shape.'''
+    statement = PLACEHOLDER_LIST.sub('(...)', statement)
+    return ' '.join(statement.split())
+
+
+class QueryBudget:
+    '''Counts the SQL statements each request runs.
+
+    In 'warn' mode a request over its route's budget in BUDGETS, or one
+    that runs the same statement shape `repeat_threshold` times or more
+    (the usual sign of an N+1 loop), is logged through app.logger. In
+    'strict' mode going over the budget also raises QueryBudgetExceeded,
+    which fails the request and with it the test that made it. 'off'
+    installs nothing.
+    '''
+
+    def __init__(self, mode='off', budgets=None, repeat_threshold=5):
+        self.mode = mode
+        self.budgets = BUDGETS if budgets is None else budgets
+        self.repeat_threshold = repeat_threshold
+        self.observed = {}
+        self.violations = []
+        self._listening = False
+
+    def init_app(self, app):
+        if self.mode == 'off':
+            return
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self._count)
+            self._listening = True
+        app.before_request(self._start_request)
+        app.after_request(self._check_request)
+
+    def _count(self, conn, cursor, statement, parameters, context,
+               executemany):
+        if has_request_context() and g.get('query_budget') is self:
+            g.query_statements.append(statement)
+
+    def _start_request(self):
+        g.query_budget = self
+        g.query_statements = []
+
+    def _check_request(self, response):
+        if g.get('query_budget') is not self or request.url_rule is None:
+            return response
+        statements = g.query_statements
+        # Checked once: a strict failure runs the after_request hooks again
+        # for the error response.
+        g.query_budget = None
+        route = (request.method, request.url_rule.rule)
+        count = len(statements)
+        self.observed[route] = max(self.observed.get(route, 0), count)
+        logger = current_app.logger
+        for shape, repeats in Counter(
+                statement_shape(s) for s in statements).most_common():
+            if repeats < self.repeat_threshold:
+                break
+            logger.warning('%s %s ran the same statement %d times: %s',
+                           route[0], route[1], repeats, shape)
+        budget = self.budgets.get(route)
+        if budget is not None and count > budget:
+            self.violations.append((route, count, budget))
+            message = '{} {} ran {} statements, over its budget of {}'.format(
+                route[0], route[1], count, budget)
+            logger.warning(message)
+            if self.mode == 'strict':
+                raise QueryBudgetExceeded(message)
+        return response
+
+
+query_budget = QueryBudget(api_config['QUERY_BUDGET'],
+                           repeat_threshold=api_config[
+                               'QUERY_REPEAT_THRESHOLD'])
@@ -0,0 +1,147 @@
+import time
+import hashlib
+import threading
+from flask import g, request
+from models import db, CatalogVersion
+from config import db_config
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_COOKIE = 'read_primary_until'
+
+VERSION_QUERY = CatalogVersion.__table__.select().with_only_columns(
+    [CatalogVersion.version]).where(CatalogVersion.id == 1)
+
+
+class ReplicaRouter:
+    '''Sends read-only requests to the `replica` bind and writes to the
+    primary.
+
+    A client that has just written reads from the primary for
+    `read_your_writes` seconds: the write response sets a cookie saying
+    until when, and the worker also remembers it by Authorization header
+    for clients that drop cookies. The replica is also skipped while it is
+    unreachable or has been behind the primary for more than `max_lag`
+    seconds, judged by comparing their catalog versions at most every
+    `check_interval` seconds. Without a replica bind nothing is installed
+    and every query goes to the primary.
+    '''
+
+    def __init__(self, read_your_writes=5, max_lag=5, check_interval=1):
+        self.read_your_writes = read_your_writes
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.enabled = False
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self.lag_fallbacks = 0
+        self._pins = {}
+        self._healthy = True
+        self._behind_since = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+        self._check_lock = threading.Lock()
+
+    def init_app(self, app):
+        if 'replica' not in app.config.get('SQLALCHEMY_BINDS', {}):
+            return
+        self.enabled = True
+        # Registered before the query budget's hooks, so the occasional lag
+        # check is not counted against the request that runs it.
+        app.before_request(self._route)
+        app.after_request(self._pin_after_write)
+
+    def _client(self):
+        auth = request.headers.get('Authorization')
+        if auth is None:
+            return None
+        return hashlib.sha256(auth.encode('utf-8')).hexdigest()
+
+    def pinned(self):
+        '''Whether this request's client wrote within the window.'''
+        now = time.time()
+        try:
+            if float(request.cookies.get(PIN_COOKIE, 0)) > now:
+                return True
+        except ValueError:
+            pass
+        return self._pins.get(self._client(), 0) > now
+
+    def _route(self):
+        if request.method not in READ_METHODS:
+            return
+        if self.pinned():
+            g.read_primary = True
+            self.primary_reads += 1
+        elif self.replica_healthy():
+            g.db_bind = 'replica'
+            self.replica_reads += 1
+        else:
+            self.primary_reads += 1
+            self.lag_fallbacks += 1
+
+    def _pin_after_write(self, response):
+        if request.method in READ_METHODS or response.status_code >= 400:
+            return response
+        until = time.time() + self.read_your_writes
+        client = self._client()
+        if client is not None:
+            with self._lock:
+                if len(self._pins) >= 10000:
+                    now = time.time()
+                    self._pins = {key: value for key, value in
+                                  self._pins.items() if value > now}
+                self._pins[client] = until
+        response.set_cookie(PIN_COOKIE, '%.3f' % until,
+                            max_age=int(self.read_your_writes) + 1,
+                            httponly=True)
+        return response
+
+    def replica_healthy(self):
+        now = time.monotonic()
+        if self._checked_at is not None and \
+                now - self._checked_at < self.check_interval:
+            return self._healthy
+        # One request checks; the others keep the last answer meanwhile.
+        if not self._check_lock.acquire(blocking=False):
+            return self._healthy
+        try:
+            self._checked_at = now
+            self._healthy = self._check(now)
+        finally:
+            self._check_lock.release()
+        return self._healthy
+
+    def _check(self, now):
+        try:
+            with db.get_engine(bind='replica').connect() as connection:
+                replica = connection.execute(VERSION_QUERY).scalar()
+            with db.get_engine().connect() as connection:
+                primary = connection.execute(VERSION_QUERY).scalar()
+        except Exception:
+            self._behind_since = None
+            return False
+        if replica is not None and primary is not None and \
+                replica >= primary:
+            self._behind_since = None
+            return True
+        if self._behind_since is None:
+            self._behind_since = now
+        return now - self._behind_since <= self.max_lag
+
+    def reset(self):
+        with self._lock:
+            self._pins = {}
+            self._checked_at = None
+            self._behind_since = None
+            self._healthy = True
+
+    def stats(self):
+        return {"enabled": self.enabled, "healthy": self._healthy,
+                "replica_reads": self.replica_reads,
+                "primary_reads": self.primary_reads,
+                "lag_fallbacks": self.lag_fallbacks}
+
+
+replica_router = ReplicaRouter(db_config['READ_YOUR_WRITES'],
+                               db_config['REPLICA_MAX_LAG'],
+                               db_config['REPLICA_CHECK_INTERVAL'])
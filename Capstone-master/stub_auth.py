@@ -0,0 +1,81 @@
+import json
+import time
+import base64
+import threading
+import rsa
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from jose import jwt
+from config import auth_config
+
+
+def b64_uint(value):
+    data = value.to_bytes((value.bit_length() + 7) // 8, 'big')
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode()
+
+
+def generate_key(kid, bits=1024):
+    '''Returns a (jwk, private pem) pair for a freshly generated RSA key.'''
+    public, private = rsa.newkeys(bits)
+    jwk = {"kty": "RSA", "kid": kid, "use": "sig", "alg": "RS256",
+           "n": b64_uint(public.n), "e": b64_uint(public.e)}
+    return jwk, private.save_pkcs1().decode()
+
+
+def sign_token(pem, kid, permissions, expires_in=3600, sub="stub|user"):
+    '''Signs a token with the issuer and audience auth.py expects.'''
+    now = int(time.time())
+    claims = {
+        "iss": "https://" + auth_config['AUTH0_DOMAIN'] + "/",
+        "aud": auth_config['API_AUDIENCE'],
+        "sub": sub,
+        "iat": now,
+        "exp": now + expires_in,
+        "permissions": permissions}
+    return jwt.encode(claims, pem, algorithm='RS256', headers={"kid": kid})
+
+
+class StubJWKSServer:
+    '''Serves a JWKS document on a local port from a background thread.
+
+    Assign to `keys` to rotate the published key set, and set `fail` to
+    answer every request with a 500. `delay` seconds are slept before each
+    answer, to stand in for the round trip to Auth0.
+    '''
+
+    def __init__(self, keys, max_age=None, delay=0):
+        self.keys = keys
+        self.max_age = max_age
+        self.delay = delay
+        self.fail = False
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                time.sleep(stub.delay)
+                if stub.fail:
+                    self.send_error(500)
+                    return
+                body = json.dumps({"keys": stub.keys}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                if stub.max_age is not None:
+                    self.send_header('Cache-Control',
+                                     'max-age={}'.format(stub.max_age))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}/.well-known/jwks.json'.format(
+            self._server.server_address[1])
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
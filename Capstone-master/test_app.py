@@ -1,7 +1,13 @@
 import os
+import uuid
 import unittest
 import json
 from flask_sqlalchemy import SQLAlchemy
+
+# Fail any request that runs more SQL statements than query_budget allows.
+os.environ.setdefault('QUERY_BUDGET', 'strict')
+# The tests create the tables of a fresh database themselves.
+os.environ.setdefault('DB_CREATE_ALL', 'true')
 from models import setup_db, Movies, Actors, Relation
 from api import create_app
 from config import Authtoken, database
@@ -289,6 +295,173 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 404)
         self.assertEqual(data['success'], False)
 
+    def test_v_paginate_actors(self):
+        head = {"Authorization": self.executive_director}
+        res = self.client().get('/actors?limit=1', headers=head)
+        data = res.json
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertLessEqual(len(data['actors']), 1)
+        self.assertIn('next', data)
+
+    def test_w_paginate_movies_after_cursor(self):
+        head = {"Authorization": self.executive_director}
+        Movies(title="Page one", release_date="2001-01-01").insert()
+        Movies(title="Page two", release_date="2002-01-01").insert()
+        res = self.client().get('/movies?limit=1', headers=head)
+        first = res.json
+        self.assertIsNotNone(first['next'])
+        res = self.client().get(
+            '/movies?limit=1&after=' + first['next'], headers=head)
+        data = res.json
+
+        self.assertEqual(res.status_code, 200)
+        self.assertGreater(
+            data['movies'][0]['id'], first['movies'][0]['id'])
+
+    def test_x_error_422_paginate(self):
+        head = {"Authorization": self.executive_director}
+        res = self.client().get('/actors?limit=0', headers=head)
+        data = res.json
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+
+    def test_y_stream_movies(self):
+        head = {"Authorization": self.executive_director}
+        res = self.client().get('/movies?stream=true', headers=head)
+        data = json.loads(res.get_data())
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertIsInstance(data['movies'], list)
+
+    def test_z_error_422_bulk_add_actors(self):
+        json_data = [
+            {"name": "Bill", "age": 27, "gender": "female"},
+            {"name": "Bill", "age": 27, "gender": "jfd"},
+            {"name": "Bill"}]
+        head = [
+                ('Content-Type', 'application/json'),
+                ('Authorization', self.executive_director)]
+        res = self.client().post('/actors/bulk', json=json_data, headers=head)
+        data = res.json
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+        self.assertEqual([error['index'] for error in data['errors']], [1, 2])
+
+    def test_za_get_movies_not_modified(self):
+        head = {"Authorization": self.executive_director}
+        res = self.client().get('/movies', headers=head)
+        etag = res.headers['ETag']
+        head["If-None-Match"] = etag
+        res = self.client().get('/movies', headers=head)
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers['ETag'], etag)
+
+    def test_zb_filter_and_sort_actors(self):
+        head = {"Authorization": self.executive_director}
+        res = self.client().get(
+            '/actors?gender=female&min_age=18&sort=-age', headers=head)
+        data = res.json
+        ages = [actor['age'] for actor in data['actors']]
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(ages, sorted(ages, reverse=True))
+        for actor in data['actors']:
+            self.assertEqual(actor['gender'], 'female')
+            self.assertGreaterEqual(actor['age'], 18)
+
+    def test_zba_sort_actors_keeps_missing_ages_last(self):
+        head = {"Authorization": self.executive_director}
+        Actors(name="Ageless", age=None, gender="female").insert()
+        everyone = self.client().get('/actors', headers=head).json['actors']
+        ages, after = [], ''
+        while after is not None:
+            data = self.client().get(
+                '/actors?limit=2&sort=-age&after=' + after, headers=head).json
+            ages += [actor['age'] for actor in data['actors']]
+            after = data['next'] or None
+
+        self.assertEqual(len(ages), len(everyone))
+        known = [age for age in ages if age is not None]
+        self.assertEqual(ages[:len(known)], sorted(known, reverse=True))
+        self.assertIsNone(ages[-1])
+
+    def test_zbb_error_422_cursor_of_another_sort(self):
+        head = {"Authorization": self.executive_director}
+        Actors(name="Sorted", age=50, gender="male").insert()
+        Actors(name="Sorted", age=51, gender="male").insert()
+        first = self.client().get('/actors?limit=1&sort=age', headers=head)
+        res = self.client().get(
+            '/actors?sort=name&after=' + first.json['next'], headers=head)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(res.json['success'], False)
+
+    def test_zbc_error_422_bad_age_filter(self):
+        head = {"Authorization": self.executive_director}
+        res = self.client().get('/actors?min_age=old', headers=head)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(res.json['success'], False)
+
+    def test_zc_error_422_sort_movies(self):
+        head = {"Authorization": self.executive_director}
+        res = self.client().get('/movies?sort=actors', headers=head)
+        data = res.json
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+
+    def test_zd_sparse_fields_actors(self):
+        head = {"Authorization": self.executive_director}
+        res = self.client().get('/actors?fields=id,name', headers=head)
+        data = res.json
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        for actor in data['actors']:
+            self.assertEqual(set(actor), {'id', 'name'})
+
+    def test_ze_error_422_bulk_delete_actors(self):
+        head = {"Authorization": self.executive_director}
+        res = self.client().delete('/actors?ids=1,x', headers=head)
+        data = res.json
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+
+    def test_zf_error_422_bulk_edit_movies(self):
+        json_data = [{"id": 1, "release_date": "not a date"}]
+        head = [
+                ('Content-Type', 'application/json'),
+                ('Authorization', self.executive_director)]
+        res = self.client().patch('/movies', json=json_data, headers=head)
+        data = res.json
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['errors'][0]['index'], 0)
+
+    def test_zg_add_actor_with_idempotency_key(self):
+        json_data = {"name": "Once", "age": 40, "gender": "male"}
+        head = [
+                ('Content-Type', 'application/json'),
+                ('Authorization', self.executive_director),
+                ('Idempotency-Key', str(uuid.uuid4()))]
+        res = self.client().post('/actors', json=json_data, headers=head)
+        retry = self.client().post('/actors', json=json_data, headers=head)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json, res.json)
+        self.assertEqual(retry.headers['Idempotent-Replayed'], 'true')
+
     def tearDown(self):
         pass
 
@@ -0,0 +1,128 @@
+import json
+import unittest
+
+# Points models.py at a throwaway sqlite database, so it comes first.
+import local_database  # noqa
+import config  # noqa
+from stub_auth import generate_key, sign_token, StubJWKSServer  # noqa
+
+try:
+    from starlette.testclient import TestClient
+    import asgi
+except ImportError:
+    asgi = None
+
+PERMISSIONS = ['get:actors', 'get:movies', 'post:actors', 'delete:actor']
+
+
+@unittest.skipIf(asgi is None, "requirements-async.txt is not installed")
+class AsgiTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        from bench_data import seed
+        jwk, cls.pem = generate_key("asgi")
+        cls.server = StubJWKSServer([jwk])
+        config.auth_config['JWKS_URL'] = cls.server.url
+        with asgi.flask_app.app_context():
+            seed(20, 3)
+        cls.head = {"Authorization": "Bearer " + sign_token(
+            cls.pem, "asgi", PERMISSIONS)}
+        cls.flask = asgi.flask_app.test_client()
+        cls.client = TestClient(asgi.app)
+        cls.client.__enter__()
+
+    def assert_same(self, url, headers=None):
+        headers = self.head if headers is None else headers
+        res = self.client.get(url, headers=headers)
+        expected = self.flask.get(url, headers=headers)
+        self.assertEqual(res.status_code, expected.status_code, url)
+        self.assertEqual(json.loads(res.content),
+                         json.loads(expected.get_data()), url)
+        return res
+
+    def test_a_list_responses_match_flask(self):
+        for url in ['/actors', '/movies?limit=5&sort=-release_date',
+                    '/movies?fields=title&include=actors',
+                    '/actors?name=actor%201&sort=name', '/actors?limit=5',
+                    '/actors?limit=5&after=WzVd', '/actors?stream=true']:
+            self.assert_same(url)
+
+    def test_b_errors_match_flask(self):
+        self.assert_same('/actors?limit=0')
+        self.assert_same('/actors?sort=bogus')
+        # base64 of `true`, which is not an id.
+        res = self.assert_same('/actors?after=dHJ1ZQ')
+        self.assertEqual(res.status_code, 422)
+        self.assert_same('/actors', headers={})
+        self.assert_same('/movies', headers={
+            "Authorization": "Bearer " + sign_token(
+                self.pem, "asgi", ['get:actors'])})
+
+    def test_c_not_modified(self):
+        res = self.assert_same('/movies')
+        res = self.client.get('/movies', headers=dict(
+            self.head, **{"If-None-Match": res.headers['etag']}))
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers['vary'], 'Accept-Encoding')
+
+    def test_ca_etag_per_encoding(self):
+        tags = {}
+        for encoding in ('gzip', 'identity'):
+            head = dict(self.head, **{"Accept-Encoding": encoding})
+            tags[encoding] = self.client.get(
+                '/movies', headers=head).headers['etag']
+            expected = self.flask.get('/movies', headers=head)
+            self.assertEqual(tags[encoding], expected.headers['ETag'])
+        self.assertNotEqual(tags['gzip'], tags['identity'])
+        self.assertTrue(tags['gzip'].endswith('-gzip"'))
+
+    def test_d_writes_are_served_by_flask(self):
+        res = self.client.post('/actors', headers=self.head, json={
+            "name": "Asgi", "age": 30, "gender": "female"})
+        self.assertEqual(res.status_code, 200)
+        res = self.client.get('/actors?name=asgi', headers=self.head)
+        self.assertEqual(res.json()["actors"][0]["name"], "Asgi")
+
+    def test_e_missing_sort_values_come_last(self):
+        from models import db, Actors
+        with asgi.flask_app.app_context():
+            db.session.add_all([Actors(name=None, age=None, gender="male")
+                                for i in range(3)])
+            db.session.commit()
+        for sort in ('age', '-age', 'name'):
+            url = '/actors?limit=7&sort=' + sort
+            values, data = [], {"next": None}
+            while True:
+                after = data["next"]
+                data = self.assert_same(
+                    url + ('&after=' + after if after else '')).json()
+                values += [actor[sort.lstrip('-')]
+                           for actor in data["actors"]]
+                if data["next"] is None:
+                    break
+            known = [value for value in values if value is not None]
+            self.assertEqual(values[len(known):], [None] * 3, sort)
+            self.assertEqual(known, sorted(known, reverse=sort[0] == '-'))
+
+    def test_f_stream_in_several_batches(self):
+        # Smaller batches than rows, so the cast names of a batch are
+        # looked up before the next one is read.
+        batch_size = config.api_config['STREAM_BATCH_SIZE']
+        config.api_config['STREAM_BATCH_SIZE'] = 4
+        try:
+            for url in ['/actors?stream=true&sort=-age',
+                        '/movies?stream=true&include=actors',
+                        '/movies?stream=true&sort=release_date']:
+                self.assert_same(url)
+        finally:
+            config.api_config['STREAM_BATCH_SIZE'] = batch_size
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.__exit__(None, None, None)
+        cls.server.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import tempfile
+import unittest
+import auth
+from auth import JWKSKeyStore, TokenCache, verify_decode_jwt, AuthError
+from stub_auth import generate_key, sign_token, StubJWKSServer
+
+
+class JWKSKeyStoreTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.jwk_a, cls.pem_a = generate_key("key-a")
+        cls.jwk_b, cls.pem_b = generate_key("key-b")
+
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        self.write_jwks([self.jwk_a])
+        self.store = JWKSKeyStore('file://' + self.path, ttl=600,
+                                  min_refresh_interval=30)
+
+    def write_jwks(self, keys):
+        with open(self.path, 'w') as f:
+            json.dump({"keys": keys}, f)
+
+    def test_a_fetches_once(self):
+        for i in range(5):
+            self.assertEqual(self.store.get_key("key-a")["kid"], "key-a")
+        self.assertEqual(self.store.fetches, 1)
+
+    def test_b_unknown_kid_refetches(self):
+        self.store.get_key("key-a")
+        self.write_jwks([self.jwk_a, self.jwk_b])
+        self.store.min_refresh_interval = 0
+        self.assertEqual(self.store.get_key("key-b")["kid"], "key-b")
+        self.assertEqual(self.store.fetches, 2)
+
+    def test_c_unknown_kid_refetch_is_rate_limited(self):
+        self.store.get_key("key-a")
+        for i in range(5):
+            self.assertIsNone(self.store.get_key("missing"))
+        self.assertEqual(self.store.fetches, 1)
+
+    def test_d_keeps_last_good_keys_on_failure(self):
+        self.store.get_key("key-a")
+        os.remove(self.path)
+        self.assertFalse(self.store.refresh(force=True))
+        self.assertEqual(self.store.fetch_errors, 1)
+        self.assertEqual(self.store.get_key("key-a")["kid"], "key-a")
+
+    def test_e_refetches_after_ttl(self):
+        self.store.ttl = 0
+        self.store.min_refresh_interval = 0
+        self.store.get_key("key-a")
+        self.store.get_key("key-a")
+        self.assertEqual(self.store.fetches, 2)
+
+    def test_f_verify_decode_jwt_uses_store(self):
+        original = auth.jwks_store
+        auth.jwks_store = self.store
+        try:
+            token = sign_token(self.pem_a, "key-a", ["get:actors"])
+            payload = verify_decode_jwt(token)
+            self.assertEqual(payload["permissions"], ["get:actors"])
+            token = sign_token(self.pem_b, "key-b", ["get:actors"])
+            with self.assertRaises(AuthError):
+                verify_decode_jwt(token)
+        finally:
+            auth.jwks_store = original
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class JWKSRefresherTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.jwk_a, cls.pem_a = generate_key("key-a")
+        cls.jwk_b, cls.pem_b = generate_key("key-b")
+
+    def setUp(self):
+        self.server = StubJWKSServer([self.jwk_a], max_age=2)
+        self.store = JWKSKeyStore(self.server.url, min_refresh_interval=0,
+                                  refresh_margin=1)
+        self.store.refresh(force=True)
+
+    def wait_for(self, condition, timeout=5):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            if time.monotonic() > deadline:
+                self.fail("condition not met in time")
+            time.sleep(0.05)
+
+    def test_a_refreshes_before_expiry(self):
+        self.store.start_refresher()
+        self.server.keys = [self.jwk_a, self.jwk_b]
+        self.wait_for(lambda: self.server.requests >= 2)
+        self.assertEqual(self.store.get_key("key-b")["kid"], "key-b")
+        self.assertLess(self.store.stats()["age_seconds"], 2)
+
+    def test_b_requests_never_fetch(self):
+        self.server.max_age = 600
+        self.store.refresh(force=True)
+        self.store.start_refresher()
+        self.server.keys = [self.jwk_a, self.jwk_b]
+        fetches = self.store.fetches
+        self.assertEqual(self.store.get_key("key-a")["kid"], "key-a")
+        self.store.get_key("key-b")
+        self.wait_for(lambda: self.store.get_key("key-b") is not None)
+        self.assertEqual(self.store.fetches, fetches + 1)
+
+    def test_c_counts_refresh_errors(self):
+        self.server.fail = True
+        self.assertFalse(self.store.refresh(force=True))
+        self.assertFalse(self.store.refresh(force=True))
+        stats = self.store.stats()
+        self.assertEqual(stats["fetch_errors"], 2)
+        self.assertEqual(stats["consecutive_errors"], 2)
+        self.assertEqual(self.store.get_key("key-a")["kid"], "key-a")
+        self.server.fail = False
+        self.assertTrue(self.store.refresh(force=True))
+        self.assertEqual(self.store.stats()["consecutive_errors"], 0)
+
+    def test_d_stop_refresher(self):
+        self.store.start_refresher()
+        self.assertTrue(self.store.stats()["refresher_running"])
+        self.store.stop_refresher()
+        self.assertFalse(self.store.stats()["refresher_running"])
+
+    def tearDown(self):
+        self.store.stop_refresher()
+        self.server.close()
+
+
+class TokenCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = TokenCache(maxsize=2)
+        self.payload = {"exp": time.time() + 60, "permissions": []}
+
+    def test_a_hit_and_miss(self):
+        self.assertIsNone(self.cache.get("token"))
+        self.cache.put("token", self.payload)
+        self.assertIs(self.cache.get("token"), self.payload)
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 1)
+
+    def test_b_evicts_least_recently_used(self):
+        self.cache.put("a", self.payload)
+        self.cache.put("b", self.payload)
+        self.cache.get("a")
+        self.cache.put("c", self.payload)
+        self.assertIsNone(self.cache.get("b"))
+        self.assertIsNotNone(self.cache.get("a"))
+        self.assertIsNotNone(self.cache.get("c"))
+
+    def test_c_expires_at_exp(self):
+        self.cache.put("token", {"exp": time.time() - 1})
+        self.assertIsNone(self.cache.get("token"))
+
+    def test_d_disabled(self):
+        cache = TokenCache(maxsize=0)
+        cache.put("token", self.payload)
+        self.assertIsNone(cache.get("token"))
+
+
+if __name__ == "__main__":
+    unittest.main()
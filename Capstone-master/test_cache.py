@@ -0,0 +1,55 @@
+import unittest
+from cache import ResponseCache
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = ResponseCache(maxbytes=10, version_ttl=60)
+
+    def test_a_hit_and_miss(self):
+        self.assertIsNone(self.cache.get("key"))
+        self.cache.put("key", b"body", "application/json")
+        self.assertEqual(self.cache.get("key").body, b"body")
+        self.assertEqual(self.cache.hit_ratio, 0.5)
+
+    def test_b_evicts_by_size(self):
+        self.cache.put("a", b"aaaa", "application/json")
+        self.cache.put("b", b"bbbb", "application/json")
+        self.cache.get("a")
+        self.cache.put("c", b"cccc", "application/json")
+        self.assertIsNone(self.cache.get("b"))
+        self.assertIsNotNone(self.cache.get("a"))
+        self.assertEqual(self.cache.size, 8)
+        self.assertEqual(self.cache.evictions, 1)
+
+    def test_c_skips_bodies_larger_than_cache(self):
+        self.cache.put("big", b"x" * 11, "application/json")
+        self.assertIsNone(self.cache.get("big"))
+        self.assertEqual(self.cache.size, 0)
+
+    def test_d_version_is_reloaded_after_clear(self):
+        versions = iter([1, 2])
+        self.assertEqual(self.cache.current_version(lambda: next(versions)), 1)
+        self.assertEqual(self.cache.current_version(lambda: next(versions)), 1)
+        self.cache.clear()
+        self.assertEqual(self.cache.current_version(lambda: next(versions)), 2)
+
+    def test_e_encoded_copies_count_towards_size(self):
+        self.cache.put("a", b"aaaa", "application/json")
+        self.cache.put_encoded("a", "gzip", b"gz")
+        self.assertEqual(self.cache.get_encoded("a", "gzip"), b"gz")
+        self.assertEqual(self.cache.size, 6)
+        self.cache.put("b", b"bbbbb", "application/json")
+        self.assertIsNone(self.cache.get_encoded("a", "gzip"))
+        self.assertEqual(self.cache.size, 5)
+
+    def test_f_versions_are_kept_per_bind(self):
+        self.assertEqual(self.cache.current_version(lambda: 7), 7)
+        self.assertEqual(self.cache.current_version(lambda: 6, 'replica'), 6)
+        self.assertEqual(self.cache.cached_version(), 7)
+        self.assertEqual(self.cache.cached_version('replica'), 6)
+
+
+if __name__ == "__main__":
+    unittest.main()
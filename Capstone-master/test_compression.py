@@ -0,0 +1,37 @@
+import gzip
+import unittest
+from flask import Flask
+from compression import negotiate_encoding, compress, compress_stream
+
+
+class CompressionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = Flask(__name__)
+
+    def negotiate(self, accept, size=None):
+        with self.app.test_request_context(
+                '/', headers={"Accept-Encoding": accept}):
+            return negotiate_encoding(size)
+
+    def test_a_negotiates_gzip(self):
+        self.assertEqual(self.negotiate("gzip, deflate"), "gzip")
+        self.assertEqual(self.negotiate("*"), self.negotiate("br, gzip"))
+        self.assertIsNone(self.negotiate("identity"))
+        self.assertIsNone(self.negotiate("gzip;q=0"))
+
+    def test_b_skips_small_bodies(self):
+        self.assertIsNone(self.negotiate("gzip", size=10))
+        self.assertEqual(self.negotiate("gzip", size=100000), "gzip")
+
+    def test_c_round_trip(self):
+        body = b'{"actors":[' + b','.join(
+            b'{"name":"actor"}' for i in range(1000)) + b']}'
+        self.assertEqual(gzip.decompress(compress(body, "gzip")), body)
+        chunks = [body[i:i + 100] for i in range(0, len(body), 100)]
+        streamed = b''.join(compress_stream(iter(chunks), "gzip"))
+        self.assertEqual(gzip.decompress(streamed), body)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+import json
+import datetime
+import unittest
+from flask import Flask, jsonify
+from encoder import ENCODERS, ISODateJSONEncoder, get_dumps
+
+
+class EncoderTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.item = {"id": 1, "title": "Mymovie",
+                     "release_date": datetime.date(2011, 11, 11),
+                     "actors": ["Nélson"]}
+
+    def test_a_encoders_agree(self):
+        for name, dumps in ENCODERS.items():
+            body = dumps(self.item)
+            self.assertIsInstance(body, bytes)
+            self.assertEqual(json.loads(body), dict(
+                self.item, release_date="2011-11-11"), name)
+
+    def test_b_jsonify_writes_iso_dates(self):
+        app = Flask(__name__)
+        app.json_encoder = ISODateJSONEncoder
+        with app.app_context():
+            data = jsonify(self.item).get_json()
+        self.assertEqual(data["release_date"], "2011-11-11")
+
+    def test_c_unknown_encoder(self):
+        self.assertIs(get_dumps('stdlib'), ENCODERS['stdlib'])
+        with self.assertRaises(ValueError):
+            get_dumps('ujson')
+
+    def test_d_rejects_unknown_types(self):
+        for dumps in ENCODERS.values():
+            with self.assertRaises(TypeError):
+                dumps({"value": object()})
+
+
+if __name__ == "__main__":
+    unittest.main()
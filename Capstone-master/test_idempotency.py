@@ -0,0 +1,119 @@
+import datetime
+import unittest
+
+# Points models.py at a throwaway sqlite database, so it comes first.
+import local_database  # noqa
+import auth  # noqa
+from stub_auth import generate_key, sign_token, StubJWKSServer  # noqa
+from api import app  # noqa
+from models import db, Actors, IdempotencyKey  # noqa
+from idempotency import purge_expired  # noqa
+
+ACTOR = {"name": "Retry", "age": 30, "gender": "male"}
+
+
+class IdempotencyTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        jwk, pem = generate_key("idempotency")
+        cls.server = StubJWKSServer([jwk])
+        auth.jwks_store = auth.JWKSKeyStore(cls.server.url)
+        cls.token = "Bearer " + sign_token(
+            pem, "idempotency", ['post:actors', 'post:actor_to_movie'])
+
+    def setUp(self):
+        self.client = app.test_client()
+        with app.app_context():
+            IdempotencyKey.query.delete()
+            Actors.query.delete()
+            db.session.commit()
+
+    def post(self, url, json, key):
+        return self.client.post(url, json=json, headers={
+            "Authorization": self.token, "Idempotency-Key": key})
+
+    def count(self, name):
+        with app.app_context():
+            return Actors.query.filter(Actors.name == name).count()
+
+    def test_retry_replays_the_first_response(self):
+        first = self.post('/actors', ACTOR, 'a')
+        retry = self.post('/actors', ACTOR, 'a')
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.get_data(), first.get_data())
+        self.assertEqual(retry.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(self.count("Retry"), 1)
+
+    def test_errors_are_replayed(self):
+        first = self.post('/movies/cast', {"movie_id": 1}, 'b')
+        retry = self.post('/movies/cast', {"movie_id": 1}, 'b')
+
+        self.assertEqual(first.status_code, 422)
+        self.assertEqual(retry.status_code, 422)
+        self.assertEqual(retry.headers['Idempotent-Replayed'], 'true')
+
+    def test_key_reused_for_another_request(self):
+        self.post('/actors', ACTOR, 'c')
+        res = self.post('/actors', dict(ACTOR, age=31), 'c')
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(self.count("Retry"), 1)
+
+    def test_request_in_progress(self):
+        self.post('/actors', ACTOR, 'd')
+        with app.app_context():
+            # As if the first request had not finished yet.
+            IdempotencyKey.query.update({"status_code": None})
+            db.session.commit()
+        res = self.post('/actors', ACTOR, 'd')
+
+        self.assertEqual(res.status_code, 409)
+        self.assertEqual(self.count("Retry"), 1)
+
+    def test_request_that_never_finished(self):
+        self.post('/actors', ACTOR, 'g')
+        with app.app_context():
+            # As if the first request's worker had died while running it.
+            IdempotencyKey.query.update(
+                {"status_code": None,
+                 "locked_until": datetime.datetime(2000, 1, 1)})
+            db.session.commit()
+        res = self.post('/actors', ACTOR, 'g')
+        retry = self.post('/actors', ACTOR, 'g')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertNotIn('Idempotent-Replayed', res.headers)
+        self.assertEqual(retry.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.get_data(), res.get_data())
+        self.assertEqual(self.count("Retry"), 2)
+
+    def test_expired_keys_run_again_and_are_purged(self):
+        self.post('/actors', ACTOR, 'e')
+        self.post('/actors', dict(ACTOR, name="Other"), 'f')
+        with app.app_context():
+            IdempotencyKey.query.update(
+                {"expires_at": datetime.datetime(2000, 1, 1)})
+            db.session.commit()
+        self.post('/actors', ACTOR, 'e')
+        self.assertEqual(self.count("Retry"), 2)
+        with app.app_context():
+            self.assertEqual(purge_expired(batch_size=1), 1)
+            self.assertEqual(IdempotencyKey.query.count(), 1)
+
+    def test_without_a_key(self):
+        self.client.post('/actors', json=ACTOR,
+                         headers={"Authorization": self.token})
+        self.client.post('/actors', json=ACTOR,
+                         headers={"Authorization": self.token})
+        self.assertEqual(self.count("Retry"), 2)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import time
+import unittest
+from flask import Flask, jsonify
+from sqlalchemy import create_engine
+from metrics import Histogram, RequestMetrics, NO_PHASE
+
+
+class HistogramTestCase(unittest.TestCase):
+
+    def test_a_buckets_are_cumulative(self):
+        histogram = Histogram('latency', 'Latency.', ('route',),
+                              buckets=(0.01, 0.1))
+        for value in (0.005, 0.05, 5):
+            histogram.observe(('/actors',), value)
+        lines = histogram.render()
+        self.assertIn('latency_bucket{route="/actors",le="0.01"} 1', lines)
+        self.assertIn('latency_bucket{route="/actors",le="0.1"} 2', lines)
+        self.assertIn('latency_bucket{route="/actors",le="+Inf"} 3', lines)
+        self.assertIn('latency_count{route="/actors"} 3', lines)
+
+    def test_b_escapes_label_values(self):
+        histogram = Histogram('latency', 'Latency.', ('route',))
+        histogram.observe(('/a"b\\c',), 1)
+        self.assertIn('latency_count{route="/a\\"b\\\\c"} 1',
+                      histogram.render())
+
+
+class RequestMetricsTestCase(unittest.TestCase):
+
+    def test_a_disabled(self):
+        metrics = RequestMetrics(enabled=False)
+        app = Flask(__name__)
+        metrics.init_app(app)
+        self.assertNotIn('metrics', app.view_functions)
+        with app.test_request_context('/'):
+            self.assertIs(metrics.phase('serialize'), NO_PHASE)
+
+    def test_b_phases_exclude_database_time(self):
+        metrics = RequestMetrics(enabled=True)
+        engine = create_engine('sqlite://')
+        app = Flask(__name__)
+        metrics.init_app(app)
+
+        @app.route('/work')
+        def work():
+            with metrics.phase('serialize'):
+                time.sleep(0.01)
+                engine.execute('select 1').fetchall()
+            return jsonify({"success": True})
+
+        app.test_client().get('/work').close()
+        phases = {values[2]: series[1]
+                  for values, series in metrics.phases._series.items()}
+        self.assertGreater(phases['db'], 0)
+        self.assertGreaterEqual(phases['serialize'], 0.01)
+        self.assertEqual(
+            metrics.queries._series[('GET', '/work')][1], 1)
+        duration = metrics.duration._series[('GET', '/work', '200')][1]
+        self.assertAlmostEqual(sum(phases.values()), duration, places=6)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+from flask import Flask, jsonify
+from sqlalchemy import create_engine
+from query_budget import QueryBudget, statement_shape
+
+
+class QueryBudgetTestCase(unittest.TestCase):
+
+    def make_app(self, mode, budget):
+        self.budget = QueryBudget(mode, budgets={('GET', '/work'): budget},
+                                  repeat_threshold=3)
+        engine = create_engine('sqlite://')
+        app = Flask(__name__)
+        self.budget.init_app(app)
+
+        @app.route('/work')
+        def work():
+            for id in range(3):
+                engine.execute('select ?', id).fetchall()
+            return jsonify({"success": True})
+
+        return app
+
+    def test_a_statement_shape(self):
+        self.assertEqual(
+            statement_shape('SELECT a\n  FROM t WHERE id IN (?, ?, ?)'),
+            'SELECT a FROM t WHERE id IN (...)')
+        self.assertEqual(
+            statement_shape('SELECT a FROM t WHERE id IN '
+                            '(%(id_1)s, %(id_2)s)'),
+            'SELECT a FROM t WHERE id IN (...)')
+
+    def test_b_within_budget(self):
+        app = self.make_app('strict', 3)
+        res = app.test_client().get('/work')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(self.budget.observed[('GET', '/work')], 3)
+        self.assertEqual(self.budget.violations, [])
+
+    def test_c_strict_fails_request_over_budget(self):
+        app = self.make_app('strict', 2)
+        res = app.test_client().get('/work')
+        self.assertEqual(res.status_code, 500)
+        self.assertEqual(self.budget.violations,
+                         [(('GET', '/work'), 3, 2)])
+
+    def test_d_warn_logs_repeated_statements(self):
+        app = self.make_app('warn', 2)
+        with self.assertLogs(app.logger, 'WARNING') as logs:
+            res = app.test_client().get('/work')
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('ran the same statement 3 times: select ?',
+                      logs.output[0])
+        self.assertIn('over its budget of 2', logs.output[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+# Points models.py at a throwaway sqlite database, so it comes first.
+import local_database  # noqa
+import auth  # noqa
+from stub_auth import generate_key, sign_token, StubJWKSServer  # noqa
+from api import create_app  # noqa
+from cache import response_cache  # noqa
+from replica import replica_router  # noqa
+
+WRITER = ['get:actors', 'post:actors']
+
+
+class ReplicaTestCase(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        jwk, cls.pem = generate_key("replica")
+        cls.server = StubJWKSServer([jwk])
+        auth.jwks_store = auth.JWKSKeyStore(cls.server.url)
+        # An app of its own with a replica of the shared database, brought
+        # up to date by copying the database file over it.
+        cls.directory = tempfile.mkdtemp()
+        cls.replica_path = os.path.join(cls.directory, 'replica.db')
+        cls.app = create_app(
+            {"DATABASE_REPLICA_URL": 'sqlite:///' + cls.replica_path})
+        cls.settings = (replica_router.check_interval,
+                        response_cache.version_ttl)
+        replica_router.check_interval = 0
+        response_cache.version_ttl = 0
+
+    def setUp(self):
+        self.client = self.app.test_client()
+        response_cache.clear()
+        replica_router.reset()
+        replica_router.max_lag = 5
+        self.replicate()
+
+    def headers(self, subject):
+        return {"Authorization": "Bearer " + sign_token(
+            self.pem, "replica", WRITER, sub=subject)}
+
+    def replicate(self):
+        shutil.copy(local_database.path, self.replica_path)
+
+    def add_actor(self, client, name, headers):
+        res = client.post('/actors', headers=headers, json={
+            "name": name, "age": 30, "gender": "female"})
+        self.assertEqual(res.status_code, 200)
+
+    def names(self, client, headers):
+        res = client.get('/actors', headers=headers)
+        return [actor["name"] for actor in res.json["actors"]]
+
+    def test_a_reads_go_to_the_replica(self):
+        self.add_actor(self.app.test_client(), "Hidden",
+                       self.headers("writer"))
+        # Only the primary has the actor, so reading it means the primary.
+        self.assertNotIn("Hidden", self.names(self.client,
+                                              self.headers("reader")))
+        self.assertGreater(replica_router.replica_reads, 0)
+
+    def test_b_writer_reads_its_own_write(self):
+        writer = self.app.test_client()
+        headers = self.headers("writer")
+        self.add_actor(writer, "Mine", headers)
+
+        self.assertIn("Mine", self.names(writer, headers))
+        # Without the cookie the worker still knows the client by token.
+        self.assertIn("Mine", self.names(self.client, headers))
+        self.assertNotIn("Mine", self.names(self.client,
+                                            self.headers("reader")))
+
+    def test_c_lagging_replica_falls_back_to_the_primary(self):
+        replica_router.max_lag = 0.1
+        self.add_actor(self.app.test_client(), "Late",
+                       self.headers("writer"))
+        reader = self.headers("reader")
+        self.assertNotIn("Late", self.names(self.client, reader))
+        time.sleep(0.2)
+
+        self.assertIn("Late", self.names(self.client, reader))
+        self.assertFalse(replica_router.stats()["healthy"])
+        self.replicate()
+        self.assertIn("Late", self.names(self.client, reader))
+        self.assertTrue(replica_router.stats()["healthy"])
+
+    def test_d_unreachable_replica_falls_back_to_the_primary(self):
+        os.remove(self.replica_path)
+        os.mkdir(self.replica_path)
+        try:
+            res = self.client.get('/actors', headers=self.headers("reader"))
+            self.assertEqual(res.status_code, 200)
+            self.assertFalse(replica_router.stats()["healthy"])
+        finally:
+            os.rmdir(self.replica_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        replica_router.check_interval, response_cache.version_ttl = \
+            cls.settings
+        replica_router.reset()
+        response_cache.clear()
+        cls.server.close()
+        shutil.rmtree(cls.directory)
+
+
+if __name__ == "__main__":
+    unittest.main()
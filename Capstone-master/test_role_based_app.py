@@ -2,6 +2,11 @@ import os
 import unittest
 import json
 from flask_sqlalchemy import SQLAlchemy
+
+# Fail any request that runs more SQL statements than query_budget allows.
+os.environ.setdefault('QUERY_BUDGET', 'strict')
+# The tests create the tables of a fresh database themselves.
+os.environ.setdefault('DB_CREATE_ALL', 'true')
 from models import setup_db, Movies, Actors, Relation
 from api import create_app
 from config import Authtoken, database
@@ -343,6 +348,83 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertEqual(data['success'], True)
 
+    def test_ze_bulk_add_actors_by_casting_assistant(self):
+        json_data = [{"name": "Bill", "age": 27, "gender": "female"}]
+        head = [
+                ('Content-Type', 'application/json'),
+                ('Authorization', self.casting_assistant)]
+        res = self.client().post('/actors/bulk', json=json_data, headers=head)
+        data = res.json
+
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(data['success'], False)
+
+    def test_zf_bulk_add_movies_by_executive_director(self):
+        json_data = [
+            {"title": "Yourmovie", "release_date": "11/11/2011"},
+            {"title": "Mymovie", "release_date": "12/12/2012"}]
+        head = [
+                ('Content-Type', 'application/json'),
+                ('Authorization', self.executive_director)]
+        res = self.client().post('/movies/bulk', json=json_data, headers=head)
+        data = res.json
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(len(data['movies']), 2)
+        ans = Movies.query.filter(
+            Movies.id == data['movies'][1]['id']).one_or_none()
+        self.assertEqual(ans.title, "Mymovie")
+
+    def test_zg_bulk_add_actors_to_movies_by_executive_director(self):
+        json_data = [
+            {"movie_id": 2, "actor_id": 2},
+            {"movie_id": 2, "actor_id": 2},
+            {"movie_id": 999, "actor_id": 2}]
+        head = [
+                ('Content-Type', 'application/json'),
+                ('Authorization', self.executive_director)]
+        res = self.client().post(
+            '/movies/cast/bulk', json=json_data, headers=head)
+        data = res.json
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(len(data['created']) + len(data['existing']), 1)
+        self.assertEqual(data['missing'], [{"movie_id": 999, "actor_id": 2}])
+
+    def test_zh_bulk_delete_actors_by_casting_assistant(self):
+        head = {"Authorization": self.casting_assistant}
+        res = self.client().delete('/actors?ids=1,2', headers=head)
+        data = res.json
+
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(data['success'], False)
+
+    def test_zi_bulk_delete_movies_by_executive_director(self):
+        head = {"Authorization": self.executive_director}
+        res = self.client().delete('/movies?ids=998,999', headers=head)
+        data = res.json
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['deleted'], [])
+        self.assertEqual(data['missing'], [998, 999])
+
+    def test_zj_bulk_edit_actors_by_casting_director(self):
+        json_data = [{"id": 2, "age": 54}, {"id": 999, "age": 1}]
+        head = [
+                ('Content-Type', 'application/json'),
+                ('Authorization', self.casting_director)]
+        res = self.client().patch('/actors', json=json_data, headers=head)
+        data = res.json
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertEqual(data['missing'], [999])
+        ans = Actors.query.filter(Actors.id == 2).one_or_none()
+        self.assertEqual(ans.age, 54)
+
 
 if __name__ == "__main__":
     unittest.main()